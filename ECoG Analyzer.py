@@ -1,7 +1,8 @@
 from chartView import *
 from dialogs import *
 from PySide2.QtWidgets import (QApplication, QMainWindow, QScrollArea,
-                               QSizePolicy, QToolBar)
+                               QSizePolicy, QToolBar, QInputDialog,
+                               QMessageBox)
 from PySide2.QtGui import QPalette
 import gc
 ##import pandas as pd
@@ -9,6 +10,8 @@ from data import *
 from chartWidgets import *
 from algorithms import *
 from fileHandlers import FileManager
+from fileSources import EdfSource
+from workspace import saveWorkspace, loadWorkspace
 
 '''
 
@@ -23,9 +26,11 @@ class ApplicationWindow(QMainWindow):
         self.setWindowTitle("ECoG Analyzer")
 
         self.dm = DataManager(250)      
+        self.dm.addMemoryCache(derivedCache)
         self.chm = MyChartManager(self.dm)
         self.algManager = AlgorithmsManager(self.dm, self.chm)
         self.fileManager = FileManager()
+        self.loader = None
 
         chartArea = ChartArea(self.chm)
         self.setCentralWidget(chartArea)
@@ -40,6 +45,14 @@ class ApplicationWindow(QMainWindow):
         self.file_menu = QtWidgets.QMenu('&File', self)
         self.file_menu.addAction('&Open...', self.fileOpen,
                                  QtCore.Qt.CTRL + QtCore.Qt.Key_O)
+        self.file_menu.addAction('Open &consecutive files...', self.fileOpenConsecutive)
+        self.file_menu.addAction('&Import signals...', self.importSignals)
+        self.file_menu.addAction('&Export signals...', self.showExportDialog)
+        self.file_menu.addSeparator()
+        self.file_menu.addAction('Open &workspace...', self.fileLoadWorkspace)
+        self.file_menu.addAction('&Save workspace...', self.fileSaveWorkspace,
+                                 QtCore.Qt.CTRL + QtCore.Qt.Key_S)
+        self.file_menu.addSeparator()
         self.file_menu.addAction('&Quit', self.fileQuit,
                                  QtCore.Qt.CTRL + QtCore.Qt.Key_Q)
         self.menuBar().addMenu(self.file_menu)
@@ -63,6 +76,16 @@ class ApplicationWindow(QMainWindow):
         a.triggered.connect(self.chm.showMap)
         self.gridChooser.triggered.connect(self.setChartGrid)
         self.menuBar().addMenu(self.chart_menu)
+
+        # Menu - Data
+        self.data_menu = QtWidgets.QMenu('&Data', self)
+        self.precisionAction = self.data_menu.addAction('Single precision (float32)')
+        self.precisionAction.setCheckable(True)
+        self.precisionAction.toggled.connect(self.setSinglePrecision)
+        self.data_menu.addAction('Memory budget...', self.setMemoryBudget)
+        self.data_menu.addAction('Memory usage...', self.showMemoryUsage)
+        self.data_menu.addAction('Decoder processes...', self.setDecoderProcesses)
+        self.menuBar().addMenu(self.data_menu)
         
         # Menu - Window
         self.window_menu = QtWidgets.QMenu('&Window', self)
@@ -100,12 +123,77 @@ class ApplicationWindow(QMainWindow):
         dialog.show()
         dialog.exec()
 
+    def showExportDialog(self):
+        dialog = ExportDialog(self.dm, self.fileManager, self)
+        dialog.show()
+        dialog.exec()
+
+    def importSignals(self):
+        # exported signals are read from the file when drawn or processed
+        imported = self.fileManager.importSignals()
+        if imported is None:
+            return
+        signals, fs = imported
+        if fs is not None:
+            if not self.dm.getDataGroups():
+                self.dm.setFs(fs)
+            elif fs != self.dm.getFs():
+                print('imported signals sampled at', fs, 'Hz')
+        with self.dm.batch():
+            for gName in signals:
+                if gName not in self.dm.getDataGroups():
+                    self.dm.createDataGroup(gName)
+                for sName in signals[gName]:
+                    chNames, data = signals[gName][sName]
+                    rNames = self.dm[gName].getRowNames()
+                    newChannels = [ch for ch in chNames if ch not in rNames]
+                    if newChannels:
+                        self.dm.addChannels(gName, newChannels)
+                    if sName in self.dm[gName].getColumnNames():
+                        self.dm.changeSignal(gName, sName, chNames, data)
+                    else:
+                        self.dm.appendSignal(gName, sName, chNames, data)
+
     def changeDockWidgetVisible(self):
         self.toolWidget.setVisible(not self.toolWidget.isVisible())
 
     def changeChartAutoscale(self, state):
         self.chm.getChart().setAutoscaleY(state)
 
+    def setSinglePrecision(self, isOn):
+        self.dm.setDtype(np.float32 if isOn else np.float64)
+
+    def setMemoryBudget(self):
+        budget = self.dm.getMemoryBudget()
+        budgetGB = 0 if budget is None else int(budget/1024**3)
+        budgetGB, ok = QInputDialog.getInt(self, 'Memory budget',
+                                           'Memory for signals (GB, 0 - no limit):',
+                                           budgetGB, 0, 1024)
+        if ok:
+            self.dm.setMemoryBudget(budgetGB*1024**3 if budgetGB > 0 else None)
+
+    def setDecoderProcesses(self):
+        nWorkers = self.fileManager.getWorkers()
+        nWorkers, ok = QInputDialog.getInt(self, 'Decoder processes',
+                                           'Processes decoding EDF files (0 - one per core):',
+                                           0 if nWorkers is None else nWorkers, 0, 256)
+        if ok:
+            self.fileManager.setWorkers(nWorkers if nWorkers > 0 else None)
+
+    def showMemoryUsage(self):
+        usage = self.dm.getMemoryUsage()
+        lines = []
+        for gName in usage:
+            inMemory = sum(u[0] for u in usage[gName].values())
+            onDisk = sum(u[1] for u in usage[gName].values())
+            lines.append('{}: {:.1f} MB in memory, {:.1f} MB on disk'.format(gName, inMemory/1024**2, onDisk/1024**2))
+            for sName in usage[gName]:
+                lines.append('    {}: {:.1f} MB / {:.1f} MB'.format(sName, usage[gName][sName][0]/1024**2,
+                                                                  usage[gName][sName][1]/1024**2))
+        text = '\n'.join(lines) or 'No signals'
+        text += '\nDerived signal cache: {:.1f} MB'.format(self.dm.getCacheUsage()/1024**2)
+        QMessageBox.information(self, 'Memory usage', text)
+
     def setChartGrid(self, action):
         for a in self.gridChooser.actions():
             a.setChecked(False)
@@ -122,17 +210,119 @@ class ApplicationWindow(QMainWindow):
         except:
             return
         if ecog is not None:
+            fileName = filePath.split('/')[-1].split('.')[-2]
+            sigName = self.showRecording(wsName, fileName, ecog, chNames)
+            if isinstance(ecog, EdfSource):
+                self.startLoader(wsName, sigName, filePath, ecog, chNames)
+##            self.dm.addSignal(wsName, 'Original Signal ({})+Offset'.format(fileName), ecog+2000, chNames)
+
+    def fileOpenConsecutive(self):
+        wsName = 'Sandbox'
+
+        try:
+            filePaths, ecog, chNames = self.fileManager.openConsecutiveFiles()
+        except:
+            return
+        # read on demand from the files, nothing is cached
+        fileNames = [filePath.split('/')[-1].split('.')[-2] for filePath in filePaths]
+        self.showRecording(wsName, fileNames[0] + ' - ' + fileNames[-1], ecog, chNames)
+
+    def showRecording(self, wsName, fileName, ecog, chNames):
+        self.stopLoader()
+        if chNames is None:
+            chNames = ['CH'+str(n) for n in range(1,len(ecog)+1)] 
+        sigName = 'Original Signal ({})'.format(fileName)
+        print('ecog len', len(ecog))
+        with self.dm.batch():
             self.dm.removeAll()
+            if getattr(ecog, 'fs', None) is not None:
+                self.dm.setFs(ecog.fs)
             self.dm.createDataGroup(wsName)
-            fileName = filePath.split('/')[-1].split('.')[-2]
-            print('ecog len', len(ecog))
-            if chNames is None:
-                chNames = ['CH'+str(n) for n in range(1,len(ecog)+1)] 
             self.dm.addChannels(wsName, chNames)
-            self.dm.addSignal(wsName, 'Original Signal ({})'.format(fileName), ecog, chNames)
-##            self.dm.addSignal(wsName, 'Original Signal ({})+Offset'.format(fileName), ecog+2000, chNames)
+            self.dm.pinSignal(wsName, sigName)
+            self.dm.addSignal(wsName, sigName, ecog, chNames)
+        return sigName
+
+    def fileSaveWorkspace(self):
+        filePath = QFileDialog.getSaveFileName(self, "Save workspace", dir=".",
+                                               filter="Workspace files (*.ews)")[0]
+        if filePath == '':
+            return
+        if not filePath.endswith('.ews'):
+            filePath += '.ews'
+        settings = {'algorithm' : {'usedParam' : self.algManager.usedParam,
+                                   'inputList' : self.algManager.inputList},
+                    'chart' : self.chm.getState()}
+        try:
+            saveWorkspace(filePath, self.dm, self.chm.getChartData(), settings)
+        except Exception as e:
+            print('workspace not saved', e)
+
+    def fileLoadWorkspace(self):
+        filePath = QFileDialog.getOpenFileName(self, "Open workspace", dir=".",
+                                               filter="Workspace files (*.ews)")[0]
+        if filePath == '':
+            return
+        try:
+            state = loadWorkspace(filePath)
+        except Exception as e:
+            print('workspace not loaded', e)
+            return
+        # signals are memory-mapped from the workspace files
+        self.stopLoader()
+        with self.dm.batch():
+            self.dm.removeAll()
+            self.dm.setFs(state['fs'])
+            self.precisionAction.setChecked(state['dtype'] == np.float32)
+            self.dm.setDtype(state['dtype'])
+            for group in state['groups']:
+                gName = group['name']
+                self.dm.createDataGroup(gName, group['kind'])
+                self.dm.addChannels(gName, group['rows'])
+                for cName in group['pinned']:
+                    self.dm.pinSignal(gName, cName)
+                for sDesc in group['signals']:
+                    if sDesc['data'] is not None:
+                        self.dm.addSignal(gName, sDesc['name'], sDesc['data'], sDesc['rows'])
+        self.chm.restoreState(state['chart'], state['settings']['chart'])
+        self.algManager.usedParam = state['settings']['algorithm']['usedParam']
+        self.algManager.inputList = state['settings']['algorithm']['inputList']
+
+    def startLoader(self, wsName, sigName, filePath, source, chNames):
+        # samples are decoded into the cache while the header-only view is shown
+        self.loading = [wsName, sigName, filePath, source, chNames]
+        self.loader = self.fileManager.createLoader(filePath, source)
+        self.loader.rangeLoaded.connect(self.rangeLoaded)
+        self.loader.loadFinished.connect(self.loadFinished)
+        self.loader.start()
+
+    def stopLoader(self):
+        if self.loader is None:
+            return
+        self.loader.rangeLoaded.disconnect(self.rangeLoaded)
+        self.loader.loadFinished.disconnect(self.loadFinished)
+        self.loader.cancel()
+        self.loader.wait()
+        self.fileManager.finishLoading(self.loading[2], self.loading[3], False)
+        self.loader = None
+
+    def rangeLoaded(self, start, stop):
+        wsName, sigName, filePath, source, chNames = self.loading
+        self.dm.notifyRangeLoaded(wsName, sigName, start, stop)
+        self.statusBar().showMessage('Loading samples: {}%'.format(int(100*stop/max(source.nSamples))))
+
+    def loadFinished(self, isLoaded):
+        wsName, sigName, filePath, source, chNames = self.loading
+        self.statusBar().clearMessage()
+        cached = self.fileManager.finishLoading(filePath, source, isLoaded)
+        if cached is not None and wsName in self.dm.getDataGroups():
+            self.dm.silentChangeSignal(wsName, sigName, cached, chNames)
+        # emitted from run(), the thread finishes right after
+        self.loader.wait()
+        self.loader = None
 
     def fileQuit(self):
+        self.stopLoader()
         self.close()
 
 
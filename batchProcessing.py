@@ -0,0 +1,154 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from calculations import calcOperations, spikeDetection, spikeDefaultParameters
+from fileSources import openRecording, EdfSource, SignalCache
+from signalTypes import WindowedSignal, IntervalSet
+
+'''
+
+BATCH PROCESSING
+
+'''
+# Runs a processing pipeline over a directory of recordings without Qt.
+#
+# The pipeline is a JSON list of steps, executed in order:
+#   [{"operation": "Filtering", "name": "BPF",
+#     "params": {"btype": "bandpass", "ftype": "butter", "order": 4,
+#                "lowFreq": 8, "highFreq": 30}},
+#    {"operation": "Peak-To-Peak", "input": "BPF", "params": {"winLen": 25}},
+#    {"operation": "Energy", "input": "BPF", "params": {"winLen": 250, "hop": 1}},
+#    {"operation": "Spike detection", "params": {"window": 25}}]
+#
+# "operation" is a key of calcOperations or "Spike detection" (parameters as in
+# FirstAlgorithm.defaultParameters, missing ones take the default values).
+# "input" names the output of an earlier step, the raw recording by default.
+# Window operations take "winLen" and an optional "hop" for overlapping windows.
+#
+# Outputs are saved per step in OUTPUT_DIR/<recording>/: signals as
+# (n_channels, n_samples) .npy, STFT as .npz (f, t, Zxx), window statistics as
+# .npz (values, edges) and thresholds/spikes as .npz (starts, stops, offsets,
+# nSamples), see saveOutput.
+
+SUPPORTED_FILES = ('edf', 'mat')
+SPIKE_DETECTION = 'Spike detection'
+
+def loadSignal(filePath, defaultFs, nWorkers=None):
+    # EDF channels are decoded across nWorkers processes into the signal
+    # cache, later runs over the same file map the cached samples
+    cache = SignalCache()
+    source, chNames = openRecording(filePath, cache)
+    if isinstance(source, EdfSource):
+        try:
+            source = cache.store(filePath, source, chNames, source.fs, nWorkers)
+        except Exception as e:
+            print('caching skipped', e)
+    fs = getattr(source, 'fs', None) or defaultFs
+    channels = [np.asarray(ch) for ch in source]
+    nSamples = min(len(ch) for ch in channels)
+    data = np.array([ch[:nSamples] for ch in channels])
+    if chNames is None:
+        chNames = [str(i+1) for i in range(len(data))]
+    return data, chNames, fs
+
+def saveOutput(outDir, name, data):
+    fileName = os.path.join(outDir, name.replace(os.sep, '_'))
+    if len(data) and isinstance(data[0], list):
+        # STFT - one [f, t, Zxx] per channel
+        np.savez(fileName + '.npz',
+                 f=data[0][0], t=data[0][1],
+                 Zxx=np.array([ch[2] for ch in data]))
+    elif len(data) and isinstance(data[0], WindowedSignal):
+        # (n_channels, n_windows) values, window i covers samples edges[i]:edges[i+1]
+        np.savez(fileName + '.npz',
+                 values=np.array([ch.values for ch in data]),
+                 edges=data[0].edges)
+    elif len(data) and isinstance(data[0], IntervalSet):
+        # intervals of channel i are starts[offsets[i]:offsets[i+1]] (first
+        # sample) and stops[offsets[i]:offsets[i+1]] (one past the last)
+        offsets = np.zeros(len(data)+1, dtype=np.int64)
+        np.cumsum([len(ch.starts) for ch in data], out=offsets[1:])
+        np.savez(fileName + '.npz',
+                 starts=np.concatenate([ch.starts for ch in data]),
+                 stops=np.concatenate([ch.stops for ch in data]),
+                 offsets=offsets,
+                 nSamples=np.array([ch.nSamples for ch in data], dtype=np.int64))
+    else:
+        np.save(fileName + '.npy', np.array(data))
+
+def processFile(filePath, pipeline, outputDir, defaultFs, nDecoders=None):
+    inData, chNames, fs = loadSignal(filePath, defaultFs, nDecoders)
+    outDir = os.path.join(outputDir, os.path.splitext(os.path.basename(filePath))[0])
+    os.makedirs(outDir, exist_ok=True)
+    with open(os.path.join(outDir, 'channels.csv'), 'w', encoding='utf-8') as csvfile:
+        csv.writer(csvfile).writerow(chNames)
+
+    results = {'Input Signal' : inData}
+    for i, step in enumerate(pipeline):
+        opName = step['operation']
+        name = step.get('name', str(i) + '_' + opName)
+        stepData = results[step.get('input', 'Input Signal')]
+        if opName == SPIKE_DETECTION:
+            params = dict(spikeDefaultParameters)
+            params.update(step.get('params', {}))
+            outData, spikeMap = spikeDetection(stepData, fs, params)
+            for sName in outData:
+                results[name + ' - ' + sName] = outData[sName]
+                saveOutput(outDir, name + ' - ' + sName, outData[sName])
+            with open(os.path.join(outDir, name + ' - spike map.csv'), 'w', encoding='utf-8') as csvfile:
+                csv.writer(csvfile).writerow(spikeMap)
+        else:
+            outData = calcOperations[opName](stepData, fs, step.get('params', {}))
+            results[name] = outData
+            saveOutput(outDir, name, outData)
+    return filePath
+
+def findRecordings(inputDir):
+    files = sorted(os.listdir(inputDir))
+    return [os.path.join(inputDir, f) for f in files
+            if f.split('.')[-1].lower() in SUPPORTED_FILES]
+
+def checkPipeline(pipeline):
+    for step in pipeline:
+        opName = step.get('operation')
+        if opName != SPIKE_DETECTION and opName not in calcOperations:
+            raise ValueError('Unknown operation: ' + str(opName))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ECoG Analyzer batch processing')
+    parser.add_argument('inputDir', help='directory with *.edf / *.mat recordings')
+    parser.add_argument('pipeline', help='pipeline specification (JSON file)')
+    parser.add_argument('-o', '--output', default='output', help='output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('-d', '--decoders', type=int, default=None,
+                        help='processes decoding the channels of one EDF file '
+                             '(default - the cores left over by the files processed at once)')
+    parser.add_argument('--fs', type=float, default=250, help='sampling rate of files without one')
+    args = parser.parse_args(argv)
+
+    with open(args.pipeline, encoding='utf-8') as f:
+        pipeline = json.load(f)
+    checkPipeline(pipeline)
+
+    files = findRecordings(args.inputDir)
+    print(len(files), 'files to process')
+    nJobs = args.jobs or os.cpu_count() or 1
+    nDecoders = args.decoders or max(1, (os.cpu_count() or 1)//max(1, min(nJobs, len(files))))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=nJobs) as pool:
+        futures = {pool.submit(processFile, filePath, pipeline, args.output, args.fs, nDecoders) : filePath
+                   for filePath in files}
+        for future in as_completed(futures):
+            try:
+                print('done', future.result())
+            except Exception as e:
+                failed += 1
+                print('error', futures[future], e)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
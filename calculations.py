@@ -1,18 +1,661 @@
+import os
 import sys
+import threading
+import functools
+import itertools
+from collections import OrderedDict
 import numpy as np
 from scipy import signal
-from PySide2.QtWidgets import (QDialog, QComboBox, QGridLayout, QLabel,
-                               QHBoxLayout, QGroupBox, QFormLayout,
-                               QLineEdit, QFrame, QSpinBox, QDialogButtonBox,
-                               QPushButton, QVBoxLayout, QStackedLayout,
-                               QErrorMessage)
-from PySide2.QtCore import Qt
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fileSources import LazyChannel
+from signalTypes import (WindowedSignal, windowEdges, hopEdges, windowedSignals,
+                         IntervalSet, windowIntervals, thresholdIntervals)
 
 def filterCalc(order, bandarr, fs, btype, ftype):
+    # second-order sections, stable also for high orders and narrow bands
     nyq = 0.5 * fs
     bandarr = [i/nyq for i in bandarr]
+    if len(bandarr) == 1:
+        bandarr = bandarr[0]
     if ftype == 'butter':
-        b, a = signal.butter(order, bandarr, btype=btype, analog=False)
+        sos = signal.butter(order, bandarr, btype=btype, analog=False, output='sos')
     if ftype == 'bessel':
-        b, a = signal.bessel(order, bandarr, btype=btype)
-    return b, a
+        sos = signal.bessel(order, bandarr, btype=btype, output='sos')
+    return sos
+
+def sosFilter(sos, data, zeroPhase=False):
+    # all channels in one call along the time axis, in float64;
+    # zero phase filters forwards and backwards
+    data = np.asarray(data, dtype=np.float64)
+    if zeroPhase:
+        return signal.sosfiltfilt(sos, data, axis=-1)
+    return signal.sosfilt(sos, data, axis=-1)
+
+'''
+
+################## PROCESSING OPERATIONS ##################
+
+'''
+# Every operation takes (inData, fs, params, dtype, progress) and returns one
+# output per input channel. They are shared by the processing dialogs and the
+# batch command line, so nothing here may depend on Qt.
+
+def _progress(progress, prog):
+    if progress is not None:
+        progress(int(prog))
+
+def filterBand(params):
+    if params['btype'] == 'lowpass':
+        return [params['highFreq']]
+    if params['btype'] == 'highpass':
+        return [params['lowFreq']]
+    return [params['lowFreq'], params['highFreq']]
+
+def filterOperation(inData, fs, params, dtype=np.float64, progress=None):
+    sos = filterCalc(order=params['order'],
+                     bandarr=filterBand(params),
+                     fs=fs,
+                     btype=params['btype'],
+                     ftype=params['ftype'])
+    # IIR filtering stays in float64, only the result is stored as dtype
+    outData = sosFilter(sos, inData, params.get('zeroPhase', False)).astype(dtype, copy=False)
+    _progress(progress, 100)
+    return outData
+
+def filterMargin(sos, tol=1e-12):
+    # samples until the impulse response of the filter decays below tol
+    poles = signal.sos2zpk(sos)[1]
+    if len(poles) == 0:
+        return 0
+    r = np.max(np.abs(poles))
+    if r >= 1:
+        return None
+    if r == 0:
+        return 2*len(sos) + 1
+    return int(np.ceil(np.log(tol)/np.log(r))) + 2*len(sos) + 1
+
+def filterRange(source, start, stop, fs, params, dtype=np.float64):
+    sos = filterCalc(order=params['order'],
+                     bandarr=filterBand(params),
+                     fs=fs,
+                     btype=params['btype'],
+                     ftype=params['ftype'])
+    zeroPhase = params.get('zeroPhase', False)
+    # earlier samples only warm the filter up, without them it starts at 0;
+    # the backward pass of zero phase filtering needs later samples as well
+    margin = filterMargin(sos)
+    dataStart = 0 if margin is None else max(0, start-margin)
+    dataStop = stop
+    if zeroPhase:
+        dataStop = len(source) if margin is None else min(len(source), stop+margin)
+    data = np.asarray(source[dataStart:dataStop], dtype=np.float64)
+    return sosFilter(sos, data, zeroPhase)[start-dataStart:stop-dataStart].astype(dtype, copy=False)
+
+STREAM_CHUNK = 1 << 16
+
+def readBlock(inData, start, stop):
+    return np.array([np.asarray(ch[start:stop], dtype=np.float64) for ch in inData])
+
+def streamFilter(inData, sos, out, zeroPhase=False, work=None, chunkLen=STREAM_CHUNK,
+                 progress=None, cancelled=None):
+    # Filters all channels chunk by chunk, carrying the filter state between
+    # chunks, so out is identical to sosfilt (or sosfiltfilt with its default
+    # odd padding) of the whole signal. Only chunks are kept in memory, out
+    # may be memory-mapped. work holds the float64 forward pass of zero phase
+    # filtering, out itself by default. Returns None when cancelled.
+    nSamples = len(inData[0])
+    starts = range(0, nSamples, chunkLen)
+    if not zeroPhase:
+        zi = np.zeros((len(sos), len(inData), 2))
+        for n, start in enumerate(starts):
+            if cancelled is not None and cancelled():
+                return None
+            stop = min(start+chunkLen, nSamples)
+            out[:, start:stop], zi = signal.sosfilt(sos, readBlock(inData, start, stop),
+                                                    axis=-1, zi=zi)
+            _progress(progress, 100.0*(n+1)/len(starts))
+        return out
+
+    if work is None:
+        work = out
+    # the same padding and initial state as signal.sosfiltfilt
+    nTaps = 2*len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    edge = 3*nTaps
+    if nSamples <= edge:
+        raise ValueError('The length of the input vector x must be greater '
+                         'than padlen, which is {}.'.format(edge))
+    ziStep = signal.sosfilt_zi(sos)[:, np.newaxis, :]
+    head = readBlock(inData, 0, edge+1)
+    tail = readBlock(inData, nSamples-edge-1, nSamples)
+    leftExt = 2*head[:, :1] - head[:, edge:0:-1]
+    rightExt = 2*tail[:, -1:] - tail[:, -2::-1]
+
+    # forward pass
+    zi = ziStep*leftExt[:, :1]
+    zi = signal.sosfilt(sos, leftExt, axis=-1, zi=zi)[1]
+    for n, start in enumerate(starts):
+        if cancelled is not None and cancelled():
+            return None
+        stop = min(start+chunkLen, nSamples)
+        work[:, start:stop], zi = signal.sosfilt(sos, readBlock(inData, start, stop),
+                                                 axis=-1, zi=zi)
+        _progress(progress, 50.0*(n+1)/len(starts))
+    rightOut = signal.sosfilt(sos, rightExt, axis=-1, zi=zi)[0]
+
+    # backward pass, from the end of the padding
+    zi = ziStep*rightOut[:, -1:]
+    zi = signal.sosfilt(sos, rightOut[:, ::-1], axis=-1, zi=zi)[1]
+    for n, start in enumerate(reversed(starts)):
+        if cancelled is not None and cancelled():
+            return None
+        stop = min(start+chunkLen, nSamples)
+        block, zi = signal.sosfilt(sos, np.array(work[:, start:stop][:, ::-1], dtype=np.float64),
+                                   axis=-1, zi=zi)
+        out[:, start:stop] = block[:, ::-1]
+        _progress(progress, 50.0 + 50.0*(n+1)/len(starts))
+    return out
+
+def filterToFile(inData, fs, params, filePath, dtype=np.float64, progress=None,
+                 chunkLen=STREAM_CHUNK, cancelled=None):
+    # the filtered signal as a read-only (n_ch, n_samples) .npy memory map,
+    # None (and no file) when cancelled or failed
+    out = work = None
+    workPath = filePath + '.work.npy'
+    isDone = False
+    try:
+        sos = filterCalc(order=params['order'],
+                         bandarr=filterBand(params),
+                         fs=fs,
+                         btype=params['btype'],
+                         ftype=params['ftype'])
+        zeroPhase = params.get('zeroPhase', False)
+        shape = (len(inData), len(inData[0]))
+        out = np.lib.format.open_memmap(filePath, mode='w+', dtype=dtype, shape=shape)
+        if zeroPhase and out.dtype != np.float64:
+            work = np.lib.format.open_memmap(workPath, mode='w+', dtype=np.float64, shape=shape)
+        isDone = streamFilter(inData, sos, out, zeroPhase, work, chunkLen,
+                              progress, cancelled) is not None
+        out.flush()
+    finally:
+        del out, work
+        if os.path.exists(workPath):
+            os.remove(workPath)
+        if not isDone and os.path.exists(filePath):
+            os.remove(filePath)
+    if not isDone:
+        return None
+    return np.load(filePath, mmap_mode='r')
+
+'''
+WINDOW
+'''
+# Window statistics take windows as an (n_ch, n_windows, window length) array
+# and reduce the last axis. winLen is the requested length, the actual windows
+# of np.array_split may be one sample longer.
+def winMean(win, winLen):
+    return np.mean(win, axis=-1)
+
+def winEnergy(win, winLen):
+    return np.sum(win**2, axis=-1)
+
+def winPower(win, winLen):
+    return np.sum(win**2, axis=-1)/winLen
+
+def winPeak2Peak(win, winLen):
+    return np.max(win, axis=-1) - np.min(win, axis=-1)
+
+def winVariance(win, winLen):
+    dev = win - np.mean(win, axis=-1, keepdims=True)
+    return np.sum(dev**2, axis=-1)/winLen
+
+def winEntropy(win, winLen):
+    return -np.sum(win*np.log(np.abs(win)), axis=-1)
+
+def winSkewness(win, winLen):
+    dev = win - np.mean(win, axis=-1, keepdims=True)
+    dev2 = dev*dev
+    nom = np.sum(dev2*dev, axis=-1)/winLen
+    denom = np.sum(dev2, axis=-1)/(winLen-1)**(3/2)
+    return nom/denom
+
+# Overlapping windows of winLen samples every hop samples. Window sums come
+# from prefix sums (centred per span for central moments), min and max from a
+# van Herk / Gil-Werman pass, so the cost does not depend on the window length.
+# fn(x, starts, length, winLen) for one float64 channel, length is winLen
+# unless the signal is shorter.
+def windowSums(x, starts, length):
+    prefix = np.concatenate(([0], np.cumsum(x)))
+    return prefix[starts+length] - prefix[starts]
+
+def slidingMax(x, length):
+    # max of x[i:i+length] for every i: running maxima forwards and backwards
+    # inside blocks of length samples, every window spans at most two blocks
+    n = len(x)
+    nBlocks = -(-n//length)
+    blocks = np.full(nBlocks*length, -np.inf)
+    blocks[:n] = x
+    blocks = blocks.reshape(nBlocks, length)
+    forward = np.maximum.accumulate(blocks, axis=1).ravel()
+    backward = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.maximum(backward[:n-length+1], forward[length-1:n])
+
+def slideMean(x, starts, length, winLen):
+    return windowSums(x, starts, length)/length
+
+def slideEnergy(x, starts, length, winLen):
+    return windowSums(x*x, starts, length)
+
+def slidePower(x, starts, length, winLen):
+    return windowSums(x*x, starts, length)/winLen
+
+def slidePeak2Peak(x, starts, length, winLen):
+    return slidingMax(x, length)[starts] + slidingMax(-x, length)[starts]
+
+def centredSums(x, starts, length, order):
+    # sums of dev, dev**2, ... dev**order over every window. Prefix sums over a
+    # whole drifting channel cancel, so consecutive windows are taken in spans
+    # of about two windows and dev is centred on the mean of its span.
+    hop = int(starts[1]-starts[0]) if len(starts) > 1 else length
+    group = max(1, length//hop)
+    nSpans = -(-len(starts)//group)
+    spanLen = (group-1)*hop + length
+    spanStep = group*hop
+    padLen = max(0, (nSpans-1)*spanStep + spanLen - len(x))
+    x = np.concatenate((x, np.full(padLen, x[-1])))
+    spans = np.lib.stride_tricks.as_strided(x, (nSpans, spanLen),
+                                            (spanStep*x.strides[0], x.strides[0]))
+    dev = spans - np.mean(spans, axis=1, keepdims=True)
+    local = np.arange(group)*hop
+    power = np.ones_like(dev)
+    sums = []
+    for k in range(order):
+        power = power*dev
+        prefix = np.concatenate((np.zeros((nSpans, 1)), np.cumsum(power, axis=1)), axis=1)
+        sums.append((prefix[:, local+length] - prefix[:, local]).ravel()[:len(starts)])
+    return sums
+
+def slideVariance(x, starts, length, winLen):
+    s1, s2 = centredSums(x, starts, length, 2)
+    return (s2 - s1*s1/length)/winLen
+
+def slideEntropy(x, starts, length, winLen):
+    # a zero sample gives nan in its windows only, not in the prefix sum
+    terms = x*np.log(np.abs(x))
+    invalid = np.isnan(terms)
+    terms[invalid] = 0
+    out = -windowSums(terms, starts, length)
+    out[windowSums(invalid, starts, length) > 0] = np.nan
+    return out
+
+def slideSkewness(x, starts, length, winLen):
+    s1, s2, s3 = centredSums(x, starts, length, 3)
+    m = s1/length
+    nom = (s3 - 3*m*s2 + 2*m*m*s1)/winLen
+    denom = (s2 - m*s1)/(winLen-1)**(3/2)
+    return nom/denom
+
+def slidingOperation(data, winLen, hop, dtype, progress, slideFunction):
+    length = min(winLen, data.shape[1])
+    edges = hopEdges(data.shape[1], length, hop)
+    starts = np.arange(len(edges)-1)*hop
+    values = np.empty((len(data), len(starts)), dtype=dtype)
+    progStep = 100.0 / len(data)
+    prog = 0
+    for i in range(len(data)):
+        values[i] = slideFunction(data[i].astype(np.float64), starts, length, winLen)
+        prog = prog + progStep
+        _progress(progress, prog)
+    return windowedSignals(values, edges)
+
+def windowBlocks(data, edges):
+    # (n_ch, n_windows, length) views of the array_split windows of a
+    # (n_ch, n_samples) array, the longer windows first, then the shorter
+    sizes = np.diff(edges)
+    nLonger = int(np.sum(sizes > sizes[-1]))
+    blocks = []
+    for first, last in ((0, nLonger), (nLonger, len(sizes))):
+        if last > first:
+            block = data[:, edges[first]:]
+            blocks.append(np.lib.stride_tricks.as_strided(
+                block, shape=(len(data), last-first, sizes[first]),
+                strides=(block.strides[0], sizes[first]*block.strides[1], block.strides[1]),
+                writeable=False))
+    return blocks
+
+def windowOperation(inData, fs, params, dtype=np.float64, progress=None,
+                    winFunction=None, slideFunction=None):
+    # one value per np.array_split window, kept as (n_channels, n_windows)
+    # values with the window edges instead of filling every sample;
+    # with a hop, overlapping windows of winLen samples
+    winLen = params['winLen']
+    data = np.asarray(inData, dtype=dtype)
+    if params.get('hop'):
+        return slidingOperation(data, winLen, params['hop'], dtype, progress, slideFunction)
+    edges = windowEdges(data.shape[1], winLen)
+    values = np.concatenate([winFunction(block, winLen) for block in windowBlocks(data, edges)],
+                            axis=1).astype(dtype, copy=False)
+    _progress(progress, 100)
+    return windowedSignals(values, edges)
+
+'''
+SPECTRUM
+'''
+def stftOperation(inData, fs, params, dtype=np.float64, progress=None):
+    progStep = 100.0 / len(inData)
+    prog = 0
+    outData = []
+    window = params['window']
+    if params.get('winParam') is not None:
+        window = (window, params['winParam'])
+    maxFreq = params['maxFreq']
+    for chData in inData:
+        f, t, Zxx = signal.stft(chData, fs=fs,
+                                nperseg=params['nPerSeg'],
+                                noverlap=params['nOverlap'],
+                                window=window)
+        f = [fi for fi in f if float(fi) <= maxFreq]
+        Zxx = Zxx[:len(f)]
+        t *= fs
+        Zxx = np.abs(Zxx).astype(dtype, copy=False)
+
+        outData.append([f, t, Zxx])
+        prog = prog + progStep
+        _progress(progress, prog)
+    return outData
+
+def cwtOperation(inData, fs, params, dtype=np.float64, progress=None):
+    progStep = 100.0 / len(inData)
+    prog = 0
+    outData = []
+    widths = np.arange(params['minScale'], params['maxScale']+1)
+    wavelet = signal.ricker
+    for chData in inData:
+        cwtmatr = signal.cwt(chData, wavelet, widths)
+        cwtmatr = abs(cwtmatr).astype(dtype, copy=False)
+        outData.append(cwtmatr)
+        prog = prog + progStep
+        _progress(progress, prog)
+    return outData
+
+'''
+THRESHOLD / DETREND
+'''
+def thresholdOperation(inData, fs, params, dtype=np.float64, progress=None):
+    # samples above the threshold as intervals, windowed input is compared
+    # once per window
+    thresh = params['threshold']
+    outData = []
+    progStep = 100.0 / len(inData)
+    prog = 0
+    for chData in inData:
+        if isinstance(chData, WindowedSignal):
+            outData.append(windowIntervals(chData.edges, chData.values > thresh, dtype))
+        else:
+            outData.append(thresholdIntervals(chData, thresh, dtype))
+        prog = prog + progStep
+        _progress(progress, prog)
+    return outData
+
+def detrendOperation(inData, fs, params, dtype=np.float64, progress=None):
+    outData = []
+    progStep = 100.0 / len(inData)
+    prog = 0
+    for chData in inData:
+        det = signal.detrend(chData, type=params['type'])
+        outData.append(det.astype(dtype, copy=False))
+        prog = prog + progStep
+        _progress(progress, prog)
+    return outData
+
+'''
+
+################## SPIKE DETECTION ##################
+
+'''
+spikeDefaultParameters = {'offset filter' : True,
+                          'supply filter' : True,
+                          'LPF highcut'   : 3,
+                          'BPF lowcut'    : 8,
+                          'BPF highcut'   : 30,
+                          'art thres'     : 100,
+                          'window'        : 25,
+                          'prev sec'      : 5,
+                          'hmt larger'    : 3,
+                          'hmt larger mean' : 2,
+                          'zero phase'    : False,
+                         }
+
+def spikeDetection(inData, fs, params, dtype=np.float64, progress=None):
+    # returns the named output signals and the spike map
+    nProgres = 5
+    progStep = 100.0/nProgres
+    prog = 0
+
+    # no copy, without noise removal the input is shared with 'Input Signal'
+    inData = np.asarray(inData, dtype=dtype)
+
+    ## Noises
+    # filters run in float64, results are kept in the storage precision
+    if params['offset filter']:
+        inData = [signal.detrend(data, type='constant').astype(dtype, copy=False) for data in inData]
+
+    zeroPhase = params['zero phase']
+    if params['supply filter']:
+        sos = filterCalc(order=5,
+                         bandarr=[48, 52],
+                         fs=fs,
+                         btype='bandstop',
+                         ftype='butter')
+        inData = sosFilter(sos, inData, zeroPhase).astype(dtype, copy=False)
+
+    winLen = params['window']
+    prog += 2*progStep
+    _progress(progress, prog)
+
+    ## Spikes
+    order=4
+    sos = filterCalc(order, [params['BPF lowcut'], params['BPF highcut']], fs, 'band', 'butter')
+    bpfData = sosFilter(sos, inData, zeroPhase).astype(dtype, copy=False)
+
+    prevSeconds = params['prev sec']
+    prevWindows = int(prevSeconds*fs/winLen)
+
+    prog += progStep
+    _progress(progress, prog)
+
+    # peak-to-peak of every window, one value per window
+    edges = windowEdges(len(bpfData[0]), winLen)
+    bpfWinData = np.concatenate([winPeak2Peak(block, winLen) for block in
+                                 windowBlocks(np.asarray(bpfData), edges)], axis=1)
+
+    prog += progStep
+    _progress(progress, prog)
+
+    hmtLarger = params['hmt larger']
+    hmtLargerMean = params['hmt larger mean']
+    # windows before prevWindows stay 0
+    thresBpfData = np.zeros_like(bpfWinData)
+
+    for ch in range(len(bpfWinData)):
+        channelMean = hmtLargerMean*np.mean(inData[ch])
+        for i in range(prevWindows, len(bpfWinData[ch])):
+            if bpfWinData[ch][i] > channelMean:
+                prev = bpfWinData[ch][i-prevWindows:i]
+                if bpfWinData[ch][i] > hmtLarger*np.mean(prev):
+                    thresBpfData[ch][i] = 1
+
+    prog += progStep
+    _progress(progress, prog)
+
+    bpfWinData = windowedSignals(bpfWinData, edges)
+    thresBpfData = [windowIntervals(edges, x == 1, dtype) for x in thresBpfData]
+    spikeMap = [x.sum()/winLen for x in thresBpfData]
+    outData = {'Input Signal' : inData,
+               'BPF' : bpfData,
+               'BPF+Window+Peak-to-peak' : bpfWinData,
+               'BPF+Threshold - Spikes' : thresBpfData}
+    return outData, spikeMap
+
+'''
+
+################## OPERATIONS REGISTRY ##################
+
+'''
+calcOperations = {'Filtering': filterOperation,
+                    'Average': functools.partial(windowOperation, winFunction=winMean,
+                                                 slideFunction=slideMean),
+                     'Energy': functools.partial(windowOperation, winFunction=winEnergy,
+                                                 slideFunction=slideEnergy),
+                      'Power': functools.partial(windowOperation, winFunction=winPower,
+                                                 slideFunction=slidePower),
+               'Peak-To-Peak': functools.partial(windowOperation, winFunction=winPeak2Peak,
+                                                 slideFunction=slidePeak2Peak),
+                   'Variance': functools.partial(windowOperation, winFunction=winVariance,
+                                                 slideFunction=slideVariance),
+                    'Entropy': functools.partial(windowOperation, winFunction=winEntropy,
+                                                 slideFunction=slideEntropy),
+                   'Skewness': functools.partial(windowOperation, winFunction=winSkewness,
+                                                 slideFunction=slideSkewness),
+               'Thresholding': thresholdOperation,
+                    'Detrend': detrendOperation,
+                       'STFT': stftOperation,
+                        'CWT': cwtOperation}
+
+'''
+
+################## DERIVED SIGNALS ##################
+
+'''
+# Operations that can compute any range of their output from a range of the
+# input, fn(source, start, stop, fs, params, dtype). Their results are kept
+# as DerivedChannel recipes and computed when a range is read.
+rangeOperations = {'Filtering': filterRange}
+
+DERIVED_CACHE_BYTES = 256 * 1024**2
+
+class ChunkCache(object):
+    # Computed chunks of all derived channels, the least recently used are
+    # dropped above maxBytes. limit is the cache's own maximum, a memory
+    # budget may set maxBytes lower. Shared by worker threads.
+    def __init__(self, limit=DERIVED_CACHE_BYTES):
+        self.limit = limit
+        self.maxBytes = limit
+        self.nbytes = 0
+        self.chunks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                self.chunks.move_to_end(key)
+            return chunk
+
+    def put(self, key, chunk):
+        with self.lock:
+            old = self.chunks.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self.chunks[key] = chunk
+            self.nbytes += chunk.nbytes
+            self.trim()
+
+    def setMaxBytes(self, maxBytes):
+        with self.lock:
+            self.maxBytes = maxBytes
+            self.trim()
+
+    def trim(self):
+        while self.nbytes > self.maxBytes and self.chunks:
+            self.nbytes -= self.chunks.popitem(last=False)[1].nbytes
+
+derivedCache = ChunkCache()
+_derivedKeys = itertools.count()
+
+class DerivedChannel(LazyChannel):
+    # source channel, operation name and parameters; computed chunks are kept
+    # in derivedCache
+    def __init__(self, source, opName, params, fs, dtype=np.float64, chunkLen=1 << 16):
+        LazyChannel.__init__(self, len(source), dtype)
+        self.source = source
+        self.opName = opName
+        self.params = dict(params)
+        self.fs = fs
+        self.chunkLen = chunkLen
+        self.key = next(_derivedKeys)
+
+    def getRecipe(self):
+        return self.source, self.opName, self.params
+
+    def readChunk(self, k):
+        chunk = derivedCache.get((self.key, k))
+        if chunk is None:
+            start = k*self.chunkLen
+            stop = min(start+self.chunkLen, self.nSamples)
+            chunk = rangeOperations[self.opName](self.source, start, stop, self.fs,
+                                                 self.params, self.dtype)
+            # cached chunks are shared by every reader
+            chunk.flags.writeable = False
+            derivedCache.put((self.key, k), chunk)
+        return chunk
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = min(self.nSamples, int(stop))
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        first, last = start//self.chunkLen, (stop-1)//self.chunkLen
+        parts = []
+        for k in range(first, last+1):
+            chunkStart = k*self.chunkLen
+            parts.append(self.readChunk(k)[max(start, chunkStart)-chunkStart:
+                                           min(stop, chunkStart+self.chunkLen)-chunkStart])
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+def derivedOperation(inData, fs, opName, params, dtype=np.float64):
+    return [DerivedChannel(chData, opName, params, fs, dtype) for chData in inData]
+
+'''
+
+################## CHANNEL JOBS ##################
+
+'''
+# An operation over many channels runs as one job per channel in a thread
+# pool, numpy and scipy release the GIL in their loops. Lazy inputs are read
+# (derived ones computed) in the jobs, file sources lock their own reads.
+
+def channelJob(opName, chData, fs, params, dtype):
+    if isinstance(chData, LazyChannel) and not isinstance(chData, (WindowedSignal, IntervalSet)):
+        chData = np.asarray(chData)
+    return calcOperations[opName]([chData], fs, params, dtype)[0]
+
+def processChannels(opName, inData, fs, params, dtype=np.float64, nWorkers=None,
+                    progress=None, cancelled=None):
+    # outputs in channel order, progress(done, total) after every channel,
+    # None when cancelled (channels being processed are left to finish)
+    if nWorkers is None:
+        nWorkers = os.cpu_count() or 1
+    nWorkers = max(1, min(nWorkers, len(inData)))
+    outData = [None]*len(inData)
+    pool = ThreadPoolExecutor(nWorkers)
+    futures = {}
+    try:
+        for i in range(len(inData)):
+            futures[pool.submit(channelJob, opName, inData[i], fs, params, dtype)] = i
+        pending = set(futures)
+        while pending:
+            if cancelled is not None and cancelled():
+                return None
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in done:
+                outData[futures[future]] = future.result()
+            if done and progress is not None:
+                progress(len(inData)-len(pending), len(inData))
+    finally:
+        # queued channels are dropped, running ones finish in the background
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
+    return outData
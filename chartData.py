@@ -30,6 +30,7 @@ class ChartDataManager(DataManager):
         self.dManager.signalRemoved.connect(self.removeSignal)
         self.dManager.channelsAdded.connect(self.addChannels)
         self.dManager.allRemoved.connect(self.removeAll)
+        self.dManager.changesCommitted.connect(self.applyChanges)
         self._create()
 
 
@@ -48,23 +49,35 @@ class ChartDataManager(DataManager):
         self.appendData(struct)
         self.dManager.signalAdded.connect(self.appendSignal)
 
+    def applyChanges(self, changes):
+        # one batch of the data manager is one batch of chart data
+        handlers = {'dataGroupAdded' : self.createDataGroup,
+                    'signalRemoved' : self.removeSignal,
+                    'channelsAdded' : self.addChannels,
+                    'allRemoved' : self.removeAll,
+                    'signalAdded' : self.appendSignal}
+        with self.batch():
+            for name, args in changes:
+                if name in handlers:
+                    handlers[name](*args)
+
     def createDataGroup(self, gName, gKind='Normal'):
         if gName in self.gNames:
             print('This name already exists')
             return
         self.mData[gName] = ChartData(self.fs)
         self.gNames.append(gName)
-        self.dataGroupAdded.emit(gName, gKind)
+        self.emitChange('dataGroupAdded', gName, gKind)
 
     def appendSignal(self, group, signalName, chList):
         color = randomColor(450)
         data = [[True, True, True, signalName, color] if ch != 'CH1' else [True, True, True, signalName, color, True] for ch in chList ]
         self.mData[group].addColumn(signalName, data, chList)
-        self.signalAdded.emit(group, signalName, chList)
+        self.emitChange('signalAdded', group, signalName, chList)
 
     def removeSignal(self, group, signal):
         self[group].removeColumn(signal)
-        self.signalRemoved.emit(group, signal)
+        self.emitChange('signalRemoved', group, signal)
 
     def appendSignalGroup(self, setName, groupName, chList=[], dataNames=[]):
         if(chList == [] and dataNames == []):
@@ -73,7 +86,7 @@ class ChartDataManager(DataManager):
             color = randomColor(500)
             data = [[False, True, dataNames, color] if ch != 'CH1' else [False, True, dataNames, color, None, True] for ch in chList ]
             self.mData[setName].addColumn(groupName, data, chList)
-        self.signalGroupAdded.emit(setName, groupName, chList)
+        self.emitChange('signalGroupAdded', setName, groupName, chList)
 
     def addSignalToGroup(self, setName, groupName, signalName):
 ##        if self[setName].isColumnEmpty(groupName):
@@ -82,7 +95,7 @@ class ChartDataManager(DataManager):
         for chData in gDataStruct[groupName]:
             chData[2].append(signalName)
             break
-        self.signalToGrupAdded.emit(setName, groupName, signalName)
+        self.emitChange('signalToGrupAdded', setName, groupName, signalName)
 
     def removeSignalFromGroup(self, setName, groupName, signalName):
         if self[setName].isColumnEmpty(groupName):
@@ -93,11 +106,11 @@ class ChartDataManager(DataManager):
             for chData in gDataStruct[groupName]:
                 chData[2].remove(signalName)
                 break
-        self.signalFromGroupRemoved.emit(setName, groupName, signalName)
+        self.emitChange('signalFromGroupRemoved', setName, groupName, signalName)
 
     def removeSignalGroup(self, setName, groupName):
         self[setName].removeColumn(groupName)
-        self.signalGroupRemoved.emit(setName, setName)
+        self.emitChange('signalGroupRemoved', setName, setName)
 
 '''
 
@@ -108,13 +121,5 @@ class ChartData(MyData):
     def __init__(self, fs):
         MyData.__init__(self)
 
-    def isColumnEmpty(self, colName):
-        isEmpty = True
-        for col in self:
-            if colName in self[col].keys():
-                isEmpty = False
-        return isEmpty
-
 
         
-            
@@ -6,8 +6,11 @@ import matplotlib
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
+from matplotlib.collections import PolyCollection
 import matplotlib.style as mplstyle
 from chartTools import MPLNavigationToolbar, Cursor
+from fileSources import LazyChannel
+from signalTypes import WindowedSignal, toIntervals
 from PySide2 import QtCore
 from PySide2.QtCore import Signal
 from PySide2 import QtWidgets
@@ -38,6 +41,8 @@ class MyMPLChart(FigureCanvas):
         self.xScale = 1
         self.dataMax = 0
         self.plotsPerAxes = 0
+        self.lazyLines = {}
+        self.lazyMasks = {}
  
         
         self.fig = Figure(figsize=(width, height), dpi=dpi)
@@ -134,6 +139,94 @@ class MyMPLChart(FigureCanvas):
         self.xmin = 0
         self.xmax = allSamp
 
+    '''
+    Lazy data
+    '''
+    def plotData(self, ax, data, offset=0, **kwargs):
+        if isinstance(data, LazyChannel):
+            # only the visible range is read from the source
+            if isinstance(data, WindowedSignal):
+                kwargs['drawstyle'] = 'steps-post'
+            x, seg = self.lazySegment(data, int(self.xmin), int(self.xmax))
+            line, = ax.plot(x, seg+offset, **kwargs)
+            self.lazyLines[line] = (data, offset)
+        else:
+            line, = ax.plot(data+offset, **kwargs)
+        return line
+
+    def lazySegment(self, data, xmin, xmax):
+        if isinstance(data, WindowedSignal):
+            # one point per visible window, drawn as steps
+            return data.steps(xmin, xmax)
+        seg = data[xmin:xmax]
+        return np.arange(xmin, xmin+len(seg)), seg
+
+    def updateLazyLines(self, xmin, xmax):
+        for line in self.lazyLines:
+            data, offset = self.lazyLines[line]
+            x, seg = self.lazySegment(data, int(xmin), int(xmax))
+            line.set_data(x, seg+offset)
+        self.updateLazyMasks(xmin, xmax)
+
+    def visibleData(self, data):
+        if isinstance(data, LazyChannel):
+            return self.lazySegment(data, int(self.xmin), int(self.xmax))[1]
+        return data
+
+    def visibleRange(self, data):
+        seg = self.visibleData(data)
+        if len(seg) == 0:
+            return 0.0, 0.0
+        return np.amin(seg), np.amax(seg)
+
+    def fitXRange(self, nSamples):
+        # a view scrolled past the end of a shorter signal starts over at 0
+        if self.xmin >= nSamples > 0:
+            self.xmin, self.xmax = 0, self.xmax - self.xmin
+            return True
+        return False
+
+    def fitYLim(self, ax, visLines):
+        # lazy lines scrolled past their end have no visible samples
+        visLines = [line for line in visLines if len(line) > 0]
+        if len(visLines) == 0:
+            return
+        visMax = [np.max(line) for line in visLines]
+        visMin = [np.min(line) for line in visLines]
+        ax.set_ylim(np.min(visMin), np.max(visMax))
+
+    def maskSpans(self, intervals, xmin, xmax, yMin, yMax):
+        starts, stops = intervals.visible(int(xmin), int(xmax)+1)
+        return [[(a, yMin), (a, yMax), (b, yMax), (b, yMin)] for a, b in zip(starts, stops)]
+
+    def fillMask(self, ax, mask, yMin, yMax, **kwargs):
+        # one rectangle per visible interval, updated with the lazy lines
+        intervals = toIntervals(mask)
+        spans = PolyCollection(self.maskSpans(intervals, self.xmin, self.xmax, yMin, yMax),
+                               **kwargs)
+        ax.add_collection(spans, autolim=False)
+        self.lazyMasks[spans] = (intervals, yMin, yMax)
+
+    def updateLazyMasks(self, xmin, xmax):
+        for spans in self.lazyMasks:
+            intervals, yMin, yMax = self.lazyMasks[spans]
+            spans.set_verts(self.maskSpans(intervals, xmin, xmax, yMin, yMax))
+
+    def refreshRange(self, start, stop):
+        if self.lazyLines and start < self.xmax and stop > self.xmin:
+            self.updateLazyLines(self.xmin, self.xmax)
+            self.draw_idle()
+
+    def lineLength(self, line):
+        if line in self.lazyLines:
+            return len(self.lazyLines[line][0])
+        return len(line.get_data()[0])
+
+    def visibleYData(self, line, xmin, xmax):
+        if line in self.lazyLines:
+            return line.get_data()[1]
+        return line.get_data()[1][xmin:xmax]
+
     '''
     Plots
     '''
@@ -143,12 +236,13 @@ class MyMPLChart(FigureCanvas):
 ##        start = time.time()
         chNames = list(dataDict.keys())
 
-        firstChType = type(dataDict[list(dataDict.keys())[0]])
-        firstChShape = np.shape(dataDict[list(dataDict.keys())[0]])
+        firstCh = dataDict[list(dataDict.keys())[0]]
         
-        if firstChType is not np.ndarray or len(firstChShape) > 1:
+        if not isinstance(firstCh, (np.ndarray, LazyChannel)) or firstCh.ndim > 1:
             return
         self.fig.clear()
+        self.lazyLines = {}
+        self.lazyMasks = {}
         allCh = len(dataDict)
         if self.plotsPerAxes == 0:
             nPlots = allCh
@@ -168,33 +262,32 @@ class MyMPLChart(FigureCanvas):
         self.yMin = np.empty(allCh, dtype=np.float64)
         self.yMax = np.empty(allCh, dtype=np.float64)
         
-        self.offsets[allCh-1] = abs(np.amin(dataDict[chNames[allCh-1]]))
-        self.yMin[allCh-1] = np.amin(dataDict[chNames[allCh-1]])
-        self.yMax[allCh-1] = np.amax(dataDict[chNames[allCh-1]])
+        if xRange is not None:
+            self.xmin, self.xmax = xRange[0], xRange[1]
+        fitted = xRange is None and self.fitXRange(len(firstCh))
+        chRange = [self.visibleRange(dataDict[ch]) for ch in chNames]
+        self.yMin[allCh-1], self.yMax[allCh-1] = chRange[allCh-1]
+        self.offsets[allCh-1] = abs(self.yMin[allCh-1])
         for ch in range(allCh-2, -1, -1):
-            self.yMin[ch] = np.amin(dataDict[chNames[ch]])
-            self.yMax[ch] = np.amax(dataDict[chNames[ch]])
+            self.yMin[ch], self.yMax[ch] = chRange[ch]
             self.offsets[ch] = (abs(self.yMin[ch]) +
                                self.yMax[ch+1] +
                                self.offsets[ch+1] + 1)
-        if mask is not None:                     
-            xMask = np.arange(len(mask[0]))
-        
         for nAx in range(len(axarr)):
             chMin = nAx*nPlots
             chMax = (nAx+1)*nPlots
             
             for ch in range(chMin, chMax):
-                axarr[nAx].plot(dataDict[chNames[ch]]+self.offsets[ch],
-                                    color=color,
-                                    linewidth=0.9,
-                                    picker=5)
+                self.plotData(axarr[nAx], dataDict[chNames[ch]],
+                              offset=self.offsets[ch],
+                              color=color,
+                              linewidth=0.9,
+                              picker=5)
                 if mask is not None:
                     ylim = axarr[nAx].get_ylim()
-                    axarr[nAx].fill_between(xMask, self.offsets[ch]+self.yMin[ch],
-                                            self.offsets[ch]+self.yMax[ch],
-                                            where=mask[ch]==1,
-                                            color=maskColor, alpha=0.5)
+                    self.fillMask(axarr[nAx], mask[ch], self.offsets[ch]+self.yMin[ch],
+                                  self.offsets[ch]+self.yMax[ch],
+                                  color=maskColor, alpha=0.5)
 
             axarr[nAx].set_yticks(self.offsets[chMin : chMax])
             axarr[nAx].set_yticklabels(chNames[chMin : chMax], color='b')
@@ -213,8 +306,10 @@ class MyMPLChart(FigureCanvas):
 ##        end = time.time()
 ##        print('drawAllChannels time:', end - start)
         self.cursor.refreshAxes()
-        self.dataMax = len(axarr[0].get_lines()[0].get_data()[0])
+        self.dataMax = len(firstCh)
         self.chartDrawn.emit(0, self.dataMax)
+        if fitted:
+            self.xRangeChanged.emit(self.xmin, self.xmax)
         self.stat = 'AllCh'
         self.activeData = sigName
 
@@ -222,6 +317,13 @@ class MyMPLChart(FigureCanvas):
                        xRange=None, colors='#4dea84', mask=None, maskColor='#fff9ed'):
 ##        start = time.time()
         self.fig.clear()
+        self.lazyLines = {}
+        self.lazyMasks = {}
+        if xRange is not None:
+            self.xmin, self.xmax = xRange[0], xRange[1]
+        lengths = [len(data) for group in dataDict.values() for data in group.values()
+                   if isinstance(data, (np.ndarray, LazyChannel)) and data.ndim == 1]
+        fitted = xRange is None and self.fitXRange(max(lengths, default=0))
         axarr = self.fig.subplots(len(dataDict), ncols=1, sharex=True,
                                               squeeze=True)
                 
@@ -236,12 +338,11 @@ class MyMPLChart(FigureCanvas):
                 
                 dataToPlot = dataDict[dName][d]
         
-                if type(dataToPlot) == np.ndarray:
-                    print(len(np.shape(dataToPlot)))
+                if isinstance(dataToPlot, (np.ndarray, LazyChannel)):
                     
-                    if len(np.shape(dataToPlot)) == 1:
+                    if dataToPlot.ndim == 1:
                         # 1D
-                        axarr[i].plot(dataToPlot,
+                        self.plotData(axarr[i], dataToPlot,
                                       label=d,
                                       linewidth=0.9,
                                       color=colors[j])
@@ -266,10 +367,9 @@ class MyMPLChart(FigureCanvas):
                     noMask = True
                 j += 1
             if mask is not None and not noMask:
-                x = np.arange(len(mask))
                 ylim = axarr[i].get_ylim()
-                axarr[i].fill_between(x, ylim[0], ylim[1], where=mask==1,
-                                      color=maskColor, alpha=0.5)
+                self.fillMask(axarr[i], mask, ylim[0], ylim[1],
+                              color=maskColor, alpha=0.5)
                     
 ##            mline.set_gid('main')
             axarr[i].set_title(dName, visible=False)
@@ -281,12 +381,10 @@ class MyMPLChart(FigureCanvas):
 
             if axarr[i].get_gid() == '2D':
                 if self.autoscaleY == True:
-                        visLines = [visLine.get_data()[1][self.xmin:self.xmax] for visLine in axarr[i].get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
+                        visLines = [self.visibleYData(visLine, self.xmin, self.xmax) for visLine in axarr[i].get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
                 else:
                         visLines = [visLine.get_data()[1] for visLine in axarr[i].get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
-                visMax = [np.max(line) for line in visLines]
-                visMin = [np.min(line) for line in visLines]
-                axarr[i].set_ylim(np.min(visMin), np.max(visMax))
+                self.fitYLim(axarr[i], visLines)
         
                 first_legend = axarr[i].legend(loc='upper right')
                 axarr[i].add_artist(first_legend)
@@ -310,14 +408,17 @@ class MyMPLChart(FigureCanvas):
 ##        end = time.time()
 ##        print('drawOneChannel time:', end - start)
         self.cursor.refreshAxes()
-        self.dataMax = len(axarr[0].get_lines()[0].get_data()[0])
+        self.dataMax = self.lineLength(axarr[0].get_lines()[0])
         self.chartDrawn.emit(0, self.dataMax)
+        if fitted:
+            self.xRangeChanged.emit(self.xmin, self.xmax)
         self.stat = 'OneCh'
         self.activeCh = chName
 
         
     def setXRange(self, xmin, xmax):
 ##        start = time.time()
+        self.updateLazyLines(xmin, xmax)
         if self.stat == 'AllCh':
             self.fig.axes[0].set_xlim(xmin, xmax)
         elif self.stat == 'OneCh':
@@ -326,10 +427,8 @@ class MyMPLChart(FigureCanvas):
 ##                ax.set_xlim(xmin, xmax)            
                 if (self.autoscaleY == True
                     and ax.get_gid() == '2D'):
-                    visLines = [visLine.get_data()[1][xmin:xmax] for visLine in ax.get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
-                    visMax = [np.max(line) for line in visLines]
-                    visMin = [np.min(line) for line in visLines]
-                    ax.set_ylim(np.min(visMin), np.max(visMax))
+                    visLines = [self.visibleYData(visLine, xmin, xmax) for visLine in ax.get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
+                    self.fitYLim(ax, visLines)
         self.fig.axes[-1].xaxis.set_major_formatter(self.formatter)
         self.draw() 
 ##        end = time.time()
@@ -373,12 +472,10 @@ class MyMPLChart(FigureCanvas):
             for ax in self.fig.axes:
                 if ax.get_gid() == '2D':
                     if self.autoscaleY == True:
-                        visLines = [visLine.get_data()[1][self.xmin:self.xmax] for visLine in ax.get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
+                        visLines = [self.visibleYData(visLine, self.xmin, self.xmax) for visLine in ax.get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
                     else:
                         visLines = [visLine.get_data()[1] for visLine in ax.get_lines() if visLine.get_gid() != 'ly' and visLine.get_gid() != 'mark']
-                    visMax = [np.max(line) for line in visLines]
-                    visMin = [np.min(line) for line in visLines]
-                    ax.set_ylim(np.min(visMin), np.max(visMax))
+                    self.fitYLim(ax, visLines)
             self.draw()
 
     def setPlotsPerAxes(self, nPlots):
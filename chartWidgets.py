@@ -84,6 +84,11 @@ class MyChartManager(QObject):
         self.fs = self.dManager.getFs()
         self.mChart = MyMPLChart()
         self.mChart.setXScale(self.fs)
+        self.dManager.rangeLoaded.connect(self.refreshRange)
+        self.dManager.fsChanged.connect(self.setFs)
+        self.toolbar = None
+        self.sStepChooser = None
+        self.vRangeChooser = None
         self.scroller = None
         self.mask = None
         self.spikeMap = None
@@ -104,34 +109,50 @@ class MyChartManager(QObject):
         self.scroller = ChartScroller(self.mChart, Qt.Horizontal)
         return self.scroller
 
+    def scrollStepOptions(self):
+        return {'1 sec' : int(1*self.fs),
+                '2 sec' : int(2*self.fs),
+                '4 sec' : int(4*self.fs),
+                '8 sec': int(8*self.fs),
+                '16 sec': int(16*self.fs),
+                '32 sec': int(32*self.fs)}
+
+    def viewRangeOptions(self):
+        return {'2 sec' : int(2*self.fs),
+                '5 sec' : int(5*self.fs),
+                '10 sec' : int(10*self.fs),
+                '20 sec' : int(20*self.fs),
+                '40 sec' : int(40*self.fs),
+                '60 sec' : int(60*self.fs),
+                '120 sec': int(120*self.fs),
+                }
+
     def createScrollStepChooser(self):
-        options = {'1 sec' : 1*self.fs,
-                   '2 sec' : 2*self.fs,
-                   '4 sec' : 4*self.fs,
-                   '8 sec': 8*self.fs,
-                   '16 sec': 16*self.fs,
-                   '32 sec': 32*self.fs}
-        sStepChooser = Chooser(options)
+        sStepChooser = Chooser(self.scrollStepOptions())
         sStepChooser.setCurrentText('2 sec')
         self.mChart.setScrollStep(sStepChooser.getCurrentValue())
         sStepChooser.currentValueChanged.connect(self.mChart.setScrollStep)
+        self.sStepChooser = sStepChooser
         return sStepChooser
 
     def createViewRangeChooser(self):
-        options = {'2 sec' : 2*self.fs,
-                   '5 sec' : 5*self.fs,
-                   '10 sec' : 10*self.fs,
-                   '20 sec' : 20*self.fs,
-                   '40 sec' : 40*self.fs,
-                   '60 sec' : 60*self.fs,
-                   '120 sec': 120*self.fs,
-                   }
-        vRangeChooser = Chooser(options)
+        vRangeChooser = Chooser(self.viewRangeOptions())
         vRangeChooser.setCurrentText('20 sec')
         self.mChart.setViewRange(vRangeChooser.getCurrentValue())
         vRangeChooser.currentValueChanged.connect(self.mChart.setViewRange)
+        self.vRangeChooser = vRangeChooser
         return vRangeChooser
 
+    def setFs(self, fs):
+        self.fs = fs
+        self.mChart.setXScale(fs)
+        if self.toolbar is not None:
+            self.toolbar.markSet.scale = 1000.0/fs
+        if self.sStepChooser is not None:
+            self.sStepChooser.setOptions(self.scrollStepOptions())
+        if self.vRangeChooser is not None:
+            self.vRangeChooser.setOptions(self.viewRangeOptions())
+
 
     def getChart(self):
         return self.mChart
@@ -193,12 +214,40 @@ class MyChartManager(QObject):
             sMaskColor = self.chartData[self.mask[0]].getDataFromStructure({self.mask[1] : channels}, inv=True)[self.mask[1]][0][4]
         self.mChart.drawAllChannels(dataToDraw, signal, mask=sMask, color=color, maskColor=sMaskColor)
 
+    def refreshRange(self, dataGroup, signal, start, stop):
+        self.mChart.refreshRange(start, stop)
+
     def setMask(self, dataGroup, signal):
         self.mask = [dataGroup, signal]
 
     def setMap(self, spikeMap):
         self.spikeMap = spikeMap
 
+    def getChartData(self):
+        return self.chartData
+
+    def getState(self):
+        spikeMap = None
+        if self.spikeMap is not None:
+            spikeMap = [float(x) for x in self.spikeMap]
+        return {'mask' : self.mask, 'spikeMap' : spikeMap}
+
+    def restoreState(self, chartGroups, state):
+        # colors, visibility and signal groups saved with a workspace
+        with self.chartData.batch():
+            for gName in chartGroups:
+                if gName not in self.chartData.getDataGroups():
+                    continue
+                for sDesc in chartGroups[gName]['signals']:
+                    if sDesc['data'] is None:
+                        if sDesc['name'] not in self.chartData[gName].getColumnNames():
+                            self.chartData[gName].addColumn(sDesc['name'])
+                        continue
+                    self.chartData[gName].addColumn(sDesc['name'], sDesc['data'], sDesc['rows'])
+                    self.chartData.emitChange('signalGroupAdded', gName, sDesc['name'], sDesc['rows'])
+        self.mask = state.get('mask')
+        self.spikeMap = state.get('spikeMap')
+
     def showMap(self):
         if self.spikeMap is not None:
             fig = plt.figure("Spikes frequency")
@@ -298,6 +347,7 @@ class DataToDrawSelector(QWidget):
         self.chartData.signalGroupRemoved.connect(self._updateAll)
         self.chartData.signalToGrupAdded.connect(self._updateAll)
         self.chartData.signalFromGroupRemoved.connect(self._updateAll)
+        self.chartData.changesCommitted.connect(self.applyChanges)
         
 
     def signalPress(self):
@@ -330,6 +380,33 @@ class DataToDrawSelector(QWidget):
         self.wsSelector.addItem(newItem)
         self.wsSelector.setCurrentItem(newItem)
         
+    def applyChanges(self, changes):
+        # the trees are rebuilt once per batch
+        structChanges = ['signalAdded', 'signalRemoved', 'signalGroupAdded',
+                         'signalGroupRemoved', 'signalToGrupAdded',
+                         'signalFromGroupRemoved']
+        addedGroups = []
+        changedGroups = []
+        for name, args in changes:
+            if name == 'allRemoved':
+                self._resetWorkspaces()
+                addedGroups = []
+                changedGroups = []
+            elif name == 'dataGroupAdded':
+                # selecting the new workspace already rebuilds the trees
+                self.addNewGroup(*args)
+                addedGroups.append(args[0])
+            elif name in structChanges and args[0] not in changedGroups:
+                changedGroups.append(args[0])
+        # the shown workspace last, its trees stay on screen
+        current = self.wsSelector.currentItem()
+        if current is not None and current.text() in changedGroups:
+            changedGroups.remove(current.text())
+            changedGroups.append(current.text())
+        for gName in changedGroups:
+            if gName not in addedGroups:
+                self._updateAll(gName)
+
     def _resetWorkspaces(self):
         self.wsSelector.currentTextChanged.disconnect(self._updateAll)
         wsCount = self.wsSelector.count()
@@ -808,6 +885,17 @@ class Chooser(QComboBox):
     def getCurrentValue(self):
         return self.itemData(self.currentIndex())
 
+    def setOptions(self, options):
+        curText = self.currentText()
+        self.blockSignals(True)
+        self.clear()
+        self.options = options
+        for opt in self.options:
+            self.addItem(opt, self.options[opt])
+        self.setCurrentText(curText)
+        self.blockSignals(False)
+        self.changeCurrentValue(self.currentIndex())
+
     def changeCurrentValue(self, curIndex):
         self.currentValueChanged.emit(self.itemData(curIndex))
 
@@ -830,7 +918,8 @@ class SignalGrouper(QDialog):
         self.gSelector.addItems(groups)
         self.gSelector.currentTextChanged.connect(self._updateGroupList)
         self.chartData.dataGroupAdded.connect(self.gSelector.addItem)
-        self.chartData.dataGroupAdded.connect(self.gSelector.addItem)
+        self.chartData.allRemoved.connect(self.gSelector.clear)
+        self.chartData.changesCommitted.connect(self.applyChanges)
         self.mLayout.addWidget(self.gSelector)
 
         self.sSelector = QListWidget()
@@ -839,9 +928,19 @@ class SignalGrouper(QDialog):
         groupBtn = QPushButton('Create group from selected')
         groupBtn.clicked.connect(self.createNewGroup)
         self.mLayout.addWidget(groupBtn)
+
+    def applyChanges(self, changes):
+        # groups created or removed inside a batch
+        for name, args in changes:
+            if name == 'allRemoved':
+                self.gSelector.clear()
+            elif name == 'dataGroupAdded':
+                self.gSelector.addItem(args[0])
         
 
     def _updateGroupList(self):
+        if self.gSelector.currentItem() is None:
+            return
         newGroup = self.gSelector.currentItem().text()
         sStruct = self.chartData[newGroup].getColStructure()
         self.sSelector.clear()
@@ -1,29 +1,418 @@
+import os
 import sys
+import threading
 import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+from signalTypes import WindowedSignal, IntervalSet
 from PySide2.QtGui import QStandardItemModel
 from PySide2.QtCore import Qt, Signal, QObject
 from PySide2.QtWidgets import (QTreeView, QTreeWidget, QTreeWidgetItem,
                                QTreeWidgetItemIterator, QMessageBox)
 
 
+def castView(data, memo, castBase):
+    # data as the same view of castBase(base) as it is of its base array,
+    # memo {id(base): (base, cast base)} casts a shared base only once
+    base = data
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    if base.dtype != data.dtype or not base.flags.c_contiguous:
+        return castBase(data)
+    if id(base) not in memo:
+        memo[id(base)] = (base, castBase(base))
+    cast = memo[id(base)][1]
+    offset = data.__array_interface__['data'][0] - base.__array_interface__['data'][0]
+    view = np.ndarray(data.shape, cast.dtype, buffer=cast,
+                      offset=offset//base.itemsize*cast.itemsize,
+                      strides=tuple(st//base.itemsize*cast.itemsize for st in data.strides))
+    view.flags.writeable = False
+    return view
+
+def castSignal(data, dtype, memo=None):
+    # floating arrays (also inside STFT [f, t, Zxx] lists) are stored as dtype;
+    # with a memo, arrays sharing a buffer are cast into one new buffer
+    if dtype is None:
+        return data
+    if isinstance(data, np.ndarray):
+        if data.dtype.kind == 'f' and data.dtype != dtype:
+            if memo is not None:
+                return castView(data, memo, lambda base: base.astype(dtype))
+            return data.astype(dtype)
+        return data
+    if isinstance(data, WindowedSignal):
+        if data.values.dtype.kind == 'f':
+            if memo is not None:
+                return data.withValues(castSignal(data.values, dtype, memo))
+            return data.astype(dtype)
+        return data
+    if isinstance(data, IntervalSet):
+        return data.astype(dtype)
+    if isinstance(data, list):
+        return [castSignal(d, dtype, memo) for d in data]
+    return data
+
+'''
+
+################# MEMORY BUDGET #################
+
+'''
+SPILL_DIR = os.path.join(os.path.expanduser('~'), '.ecog_analyzer', 'spill')
+
+def readOnlySignal(data):
+    # stored arrays are read-only views, a signal registered under several
+    # names shares one buffer and whoever modifies it has to copy first
+    if isinstance(data, np.ndarray):
+        if data.flags.writeable:
+            data = data.view()
+            data.flags.writeable = False
+        return data
+    if isinstance(data, WindowedSignal):
+        values = readOnlySignal(data.values)
+        return data if values is data.values else data.withValues(values)
+    if isinstance(data, list) and any(isinstance(d, np.ndarray) for d in data):
+        # STFT [f, t, Zxx], other lists are kept as they are
+        return [readOnlySignal(d) if isinstance(d, np.ndarray) else d for d in data]
+    return data
+
+def mappedFile(data):
+    # file behind a memory-mapped array or a view of one, None for arrays in
+    # memory (astype of a memmap is an np.memmap in memory, without a file)
+    while isinstance(data, np.ndarray):
+        fileName = getattr(data, 'filename', None)
+        if fileName is not None:
+            return fileName
+        data = data.base
+    return None
+
+def residentBuffers(data, found=None):
+    # arrays owning the memory of data, memory-mapped and lazy data excluded
+    if found is None:
+        found = {}
+    if isinstance(data, np.ndarray) and mappedFile(data) is None:
+        root = data
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+        if root.base is None:
+            found[id(root)] = root
+    elif isinstance(data, WindowedSignal):
+        residentBuffers([data.values, data.edges], found)
+    elif isinstance(data, IntervalSet):
+        residentBuffers([data.starts, data.stops], found)
+    elif isinstance(data, list):
+        for d in data:
+            residentBuffers(d, found)
+    return list(found.values())
+
+def spillData(data, path, files):
+    if (isinstance(data, np.ndarray) and mappedFile(data) is None
+        and data.dtype.kind != 'O' and data.size > 0):
+        fileName = '{}_{}.npy'.format(path, len(files))
+        np.save(fileName, data)
+        files.append(fileName)
+        return np.load(fileName, mmap_mode='r')
+    if isinstance(data, WindowedSignal):
+        return data.withValues(spillData(data.values, path, files))
+    if isinstance(data, list):
+        return [spillData(d, path, files) for d in data]
+    return data
+
+def castToFile(data, dtype, fileName, blockLen=1 << 20):
+    # data cast block by block into a new .npy file, mapped read-only
+    out = np.lib.format.open_memmap(fileName, mode='w+', dtype=dtype, shape=data.shape)
+    step = max(1, blockLen*data.shape[-1]//data.size)
+    for start in range(0, data.shape[-1], step):
+        out[..., start:start+step] = data[..., start:start+step]
+    out.flush()
+    del out
+    return np.load(fileName, mmap_mode='r')
+
+def castMapped(data, dtype, path, files, memo=None):
+    # castSignal, but memory-mapped floating arrays are cast into new files
+    # (path_n.npy) instead of memory
+    if (isinstance(data, np.ndarray) and data.dtype.kind == 'f' and data.dtype != dtype
+        and data.size > 0 and mappedFile(data) is not None):
+        def castBase(base):
+            fileName = '{}_{}.npy'.format(path, len(files))
+            cast = castToFile(base, dtype, fileName)
+            files.append(fileName)
+            return cast
+        if memo is not None:
+            return castView(data, memo, castBase)
+        return castBase(data)
+    if isinstance(data, WindowedSignal) and mappedFile(data.values) is not None:
+        return data.withValues(castMapped(data.values, dtype, path, files, memo))
+    if isinstance(data, list):
+        return [castMapped(d, dtype, path, files, memo) for d in data]
+    return castSignal(data, dtype, memo)
+
+def spilledFiles(data, spillDir, files=None):
+    # memory-mapped arrays in the spill directory, spilled or streamed there,
+    # belong to the signal and are removed with it
+    if files is None:
+        files = []
+    if isinstance(data, np.ndarray):
+        fileName = mappedFile(data)
+        if (fileName and fileName not in files
+            and os.path.dirname(os.path.abspath(fileName)) == os.path.abspath(spillDir)):
+            files.append(fileName)
+    elif isinstance(data, WindowedSignal):
+        spilledFiles(data.values, spillDir, files)
+    elif isinstance(data, list):
+        for d in data:
+            spilledFiles(d, spillDir, files)
+    return files
+
+
+class MemoryBudget(object):
+    # Derived signals over the budget are moved to memory-mapped files,
+    # least recently used first. Pinned signals always stay in memory.
+    def __init__(self, maxBytes=None, spillDir=SPILL_DIR):
+        self.maxBytes = maxBytes
+        self.spillDir = spillDir
+        self.used = 0
+        self.nSpilled = 0
+        # tracked columns, least recently used first
+        self.columns = OrderedDict()
+        # id(buffer) -> [buffer, columns using it], bytes counted once
+        self.buffers = {}
+        # caches of recomputable data, they get what the signals leave
+        self.caches = []
+
+    def setMaxBytes(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.enforce()
+
+    def addCache(self, cache):
+        # cache - nbytes, limit and setMaxBytes(), as calculations.ChunkCache
+        self.caches.append(cache)
+        self.updateCaches()
+
+    def updateCaches(self):
+        for cache in self.caches:
+            if self.maxBytes is None:
+                cache.setMaxBytes(cache.limit)
+            else:
+                cache.setMaxBytes(min(cache.limit, max(0, self.maxBytes - self.used)))
+
+    def cacheBytes(self):
+        return sum(cache.nbytes for cache in self.caches)
+
+    def register(self, column):
+        column.buffers = residentBuffers(column.data)
+        for buffer in column.buffers:
+            entry = self.buffers.get(id(buffer))
+            if entry is None:
+                self.buffers[id(buffer)] = [buffer, [column]]
+                self.used += buffer.nbytes
+            else:
+                entry[1].append(column)
+
+    def release(self, column):
+        for buffer in column.buffers:
+            entry = self.buffers[id(buffer)]
+            entry[1].remove(column)
+            if not entry[1]:
+                del self.buffers[id(buffer)]
+                self.used -= buffer.nbytes
+        column.buffers = []
+
+    def track(self, column):
+        column.spillFiles.extend(f for f in spilledFiles(column.data, self.spillDir)
+                                 if f not in column.spillFiles)
+        self.register(column)
+        self.columns[column] = True
+        self.enforce()
+
+    def untrack(self, column, keep=()):
+        # keep - files still used by the column's new data
+        if self.columns.pop(column, None) is not None:
+            self.release(column)
+        # files mapped by other signals as well stay until the last one goes
+        inUse = set(keep)
+        for other in self.columns:
+            inUse.update(other.spillFiles)
+        for fileName in column.spillFiles:
+            if fileName in inUse:
+                continue
+            try:
+                os.remove(fileName)
+            except OSError as e:
+                print('spill file not removed', e)
+        column.spillFiles = []
+        self.updateCaches()
+
+    def touch(self, column):
+        if column in self.columns:
+            self.columns.move_to_end(column)
+
+    def columnBytes(self, column):
+        # shared buffers are counted for the first signal using them
+        return sum(buffer.nbytes for buffer in column.buffers
+                   if self.buffers[id(buffer)][1][0] is column)
+
+    def isShared(self, column):
+        return any(len(self.buffers[id(buffer)][1]) > 1 for buffer in column.buffers)
+
+    def enforce(self):
+        if self.maxBytes is not None and self.used > self.maxBytes:
+            for column in list(self.columns):
+                if self.used <= self.maxBytes:
+                    break
+                # spilling a shared buffer would not free it
+                if column.pinned or not column.buffers or self.isShared(column):
+                    continue
+                self.spill(column)
+        self.updateCaches()
+
+    def spillPath(self):
+        os.makedirs(self.spillDir, exist_ok=True)
+        path = os.path.join(self.spillDir, '{}_{}'.format(os.getpid(), self.nSpilled))
+        self.nSpilled += 1
+        return path
+
+    def cast(self, data, dtype, memo=None):
+        # memory-mapped data is cast into new spill files, not into memory
+        try:
+            return castMapped(data, dtype, self.spillPath(), [], memo)
+        except OSError as e:
+            print('casting to disk skipped', e)
+            return castSignal(data, dtype, memo)
+
+    def spill(self, column):
+        path = self.spillPath()
+        try:
+            data = spillData(column.data, path, column.spillFiles)
+        except OSError as e:
+            print('spilling skipped', e)
+            return
+        self.release(column)
+        column.data = data
+        self.register(column)
+
 '''
 
 ################# MY DATA #################
 
-'''        
+'''
+def stackSignals(rData, dtype=None):
+    # equally shaped channels are kept as one (n_channels, n_samples) array,
+    # anything else (lazy sources, STFT lists, chart settings) as a list
+    if isinstance(rData, np.ndarray) and rData.ndim > 1:
+        return readOnlySignal(castSignal(rData, dtype))
+    # cast first, rows of mixed precision are stacked as well
+    rData = [castSignal(d, dtype) for d in rData]
+    if (len(rData) > 0 and all(type(d) is np.ndarray for d in rData)
+        and len(set((d.shape, d.dtype) for d in rData)) == 1):
+        return readOnlySignal(np.stack(rData))
+    return [readOnlySignal(d) for d in rData]
+
+
+class SignalColumn(object):
+    def __init__(self, rNames, data):
+        # data[rowIndex[rName]] is the signal of channel rName
+        self.rNames = list(rNames)
+        self.rowIndex = {rName : n for n, rName in enumerate(self.rNames)}
+        self.data = data
+        self.pinned = False
+        self.buffers = []
+        self.spillFiles = []
+
+    def isArray(self):
+        return isinstance(self.data, np.ndarray)
+
+    def getRow(self, rName):
+        return self.data[self.rowIndex[rName]]
+
+    def getRows(self, rNames):
+        idx = [self.rowIndex[rName] for rName in rNames]
+        if not self.isArray():
+            return [self.data[i] for i in idx]
+        if len(idx) == 0:
+            return []
+        # consecutive channels are a view, other selections need a copy
+        if idx == list(range(idx[0], idx[0]+len(idx))):
+            return self.data[idx[0]:idx[0]+len(idx)]
+        return self.data[idx]
+
+    def removeRow(self, rName):
+        i = self.rowIndex[rName]
+        rNames = self.rNames[:i] + self.rNames[i+1:]
+        if self.isArray():
+            data = np.delete(self.data, i, axis=0)
+        else:
+            data = self.data[:i] + self.data[i+1:]
+        self.rNames = rNames
+        self.rowIndex = {rName : n for n, rName in enumerate(self.rNames)}
+        self.data = readOnlySignal(data)
+
+
+class MyDataRow(object):
+    # one channel of MyData, columns are accessed by signal name
+    def __init__(self, myData, rName):
+        self.myData = myData
+        self.rName = rName
+
+    def __getitem__(self, cName):
+        column = self.myData.columns.get(cName)
+        if column is None or self.rName not in column.rowIndex:
+            raise KeyError(cName)
+        self.myData.touch(column)
+        return column.getRow(self.rName)
+
+    def __setitem__(self, cName, value):
+        self.myData.addColumn(cName, [value], [self.rName])
+
+    def __contains__(self, cName):
+        return cName in self.myData.rowColumns[self.rName]
+
+    def keys(self):
+        return list(self.myData.rowColumns[self.rName])
+
+    def values(self):
+        return [self[cName] for cName in self.keys()]
+
+    def items(self):
+        return [(cName, self[cName]) for cName in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def pop(self, cName, default=None):
+        if cName not in self:
+            return default
+        column = self.myData.columns[cName]
+        value = column.getRow(self.rName)
+        self.myData.untrack(column)
+        column.removeRow(self.rName)
+        self.myData.track(column)
+        del self.myData.rowColumns[self.rName][cName]
+        return value
+
+
 class MyData(dict):
-    def __init__(self, fs=None):
+    def __init__(self, fs=None, dtype=None, memory=None):
         dict.__init__(self)
         # row and column names
         self.fs = fs
+        self.dtype = dtype
+        self.memory = memory
+        self.pinned = set()
         self.rNames = []
         self.cNames = []
+        self.columns = {}
+        # channel -> signals index, signal -> channels is columns[cName].rNames
+        self.rowColumns = {}
         self.struct = {}
 
     def addRows(self, rNames):
         for rName in rNames:
-            self[rName] = {}
             if rName not in self.rNames:
+                self[rName] = MyDataRow(self, rName)
+                self.rowColumns[rName] = {}
                 self.rNames.append(rName)
 
     def addColumn(self, cName, rData=None, rNames=None):
@@ -35,8 +424,23 @@ class MyData(dict):
         if len(rData) != len(rNames):
             print('rData ({}) and rNames({}) must be the same length'.format(len(rData), len(rNames)))
             return
-        for n in range(len(rNames)):
-            self[rNames[n]][cName] = rData[n]
+        self.addRows(rNames)
+        column = self.columns.get(cName)
+        if column is not None and not set(column.rNames) <= set(rNames):
+            # channels not given keep their signals
+            values = {rName : column.getRow(rName) for rName in column.rNames}
+            for n in range(len(rNames)):
+                values[rNames[n]] = rData[n]
+            rNames = list(values.keys())
+            rData = list(values.values())
+        newColumn = SignalColumn(rNames, stackSignals(rData, self.dtype))
+        newColumn.pinned = cName in self.pinned
+        if column is not None:
+            self.untrack(column)
+        self.columns[cName] = newColumn
+        self.track(newColumn)
+        for rName in rNames:
+            self.rowColumns[rName][cName] = True
         if cName not in self.cNames:
             self.cNames.append(cName)
 
@@ -46,6 +450,61 @@ class MyData(dict):
     def getFs(self):
         return self.fs
 
+    def setDtype(self, dtype, memo=None):
+        # memo - shared by every MyData of one precision change, buffers shared
+        # between signals are cast once and stay shared
+        self.dtype = dtype
+        if memo is None:
+            memo = {}
+        for column in self.columns.values():
+            if self.memory is not None:
+                data = readOnlySignal(self.memory.cast(column.data, dtype, memo))
+                self.memory.untrack(column, keep=spilledFiles(data, self.memory.spillDir))
+            else:
+                data = readOnlySignal(castSignal(column.data, dtype, memo))
+            column.data = data
+            self.track(column)
+
+    def track(self, column):
+        if self.memory is not None:
+            self.memory.track(column)
+
+    def untrack(self, column):
+        if self.memory is not None:
+            self.memory.untrack(column)
+
+    def touch(self, column):
+        if self.memory is not None:
+            self.memory.touch(column)
+
+    def pinColumn(self, cName, isPinned=True):
+        if isPinned:
+            self.pinned.add(cName)
+        else:
+            self.pinned.discard(cName)
+        if cName in self.columns:
+            self.columns[cName].pinned = isPinned
+
+    def getMemoryUsage(self):
+        # {signal: [bytes in memory, bytes on disk]}
+        usage = {}
+        for cName in self.columns:
+            column = self.columns[cName]
+            onDisk = sum(os.path.getsize(f) for f in column.spillFiles if os.path.exists(f))
+            if self.memory is not None:
+                inMemory = self.memory.columnBytes(column)
+            else:
+                inMemory = sum(buffer.nbytes for buffer in residentBuffers(column.data))
+            usage[cName] = [inMemory, onDisk]
+        return usage
+
+    def clear(self):
+        for column in self.columns.values():
+            self.untrack(column)
+
+    def getDtype(self):
+        return self.dtype
+
     def getRowNames(self):
         return self.rNames
 
@@ -55,8 +514,8 @@ class MyData(dict):
     def getRowStructure(self):
 ##        return self
         struct = {}
-        for key in self:
-            struct[key] = self[key].keys()
+        for key in self.rNames:
+            struct[key] = list(self.rowColumns[key])
         return struct
 
     def getColStructure(self, cNames=None):
@@ -64,42 +523,47 @@ class MyData(dict):
             cNames = self.cNames            
         struct = {}
         for cn in cNames:
-            struct[cn] = []
-            for rn in self.keys():
-                if cn in self[rn].keys():
-                    struct[cn].append(rn)
+            struct[cn] = self.getColumnRows(cn)
         return struct
 
     def getDataFromStructure(self, struct, inv):
+        # inv - {signal: channels}, a signal of all channels is one array
         dStruct = {}
         if inv:
-            for row in struct:
-                dList = []
-                for col in struct[row]:
-                    dList.append(self[col][row])
-                dStruct[row] = dList
+            for col in struct:
+                self.touch(self.columns[col])
+                dStruct[col] = self.columns[col].getRows(struct[col])
         else:
             for row in struct:
-                dList = []
-                for col in struct[row]:
-                    dList.append(self[row][col])
-                dStruct[row] = dList
+                dStruct[row] = [self.columns[col].getRow(row) for col in struct[row]]
         return dStruct
 
     def appendDataFromStructure(self, struct, inv):
         for cName in struct:
-            for rName in struct[cName]:
-                self[rName][cName] = struct[cName][rName]
-            if cName not in self.cNames:
-                self.cNames.append(cName)
+            rNames = list(struct[cName].keys())
+            self.addColumn(cName, [struct[cName][rName] for rName in rNames], rNames)
 
     def XappendDataFromStructure(self, struct, data, inv):
         for cName in struct:
             self.addColumn(cName, data, struct[cName])
 
+    def getColumnRows(self, cName):
+        if cName not in self.columns:
+            return []
+        return list(self.columns[cName].rNames)
+
+    def getRowColumns(self, rName):
+        return list(self.rowColumns[rName])
+
+    def isColumnEmpty(self, cName):
+        return cName not in self.columns or len(self.columns[cName].rNames) == 0
+
     def removeColumn(self, cName):
-        for row in self:
-            self[row].pop(cName, None)
+        column = self.columns.pop(cName, None)
+        if column is not None:
+            self.untrack(column)
+            for rName in column.rNames:
+                self.rowColumns[rName].pop(cName, None)
         self.cNames.remove(cName)
 
 
@@ -116,79 +580,229 @@ class DataManager(QObject):
     signalRemoved = Signal(str, str)
     dataGroupAdded = Signal(str, str)
     allRemoved = Signal()
+    rangeLoaded = Signal(str, str, int, int)
+    fsChanged = Signal(float)
+    # [(signal name, args), ...] of one batch
+    changesCommitted = Signal(list)
+    # signals handed over by workers, applied on the GUI thread
+    handoverRequested = Signal(object)
         
-    def __init__(self, fs, parent=None):
+    # Threads: the data is changed on the GUI thread only, under self.lock.
+    # Workers read consistent snapshots (getSnapshot) and hand their results
+    # over with submitSignal(s), which queues them to the GUI thread where
+    # they are added in one batch. Stored arrays are read-only and replaced,
+    # never modified, so a snapshot stays valid after the lock is released.
+    def __init__(self, fs, parent=None, dtype=np.float64, memoryBudget=None):
         QObject.__init__(self, parent)
+        self.lock = threading.RLock()
         self.gNames = []
+        self.gKinds = {}
         self.mData = {}
         self.fs = fs
+        self.dtype = dtype
+        self.memory = MemoryBudget(memoryBudget)
+        self.batchLevel = 0
+        self.changes = []
+        self.handoverRequested.connect(self.applyHandover, Qt.QueuedConnection)
 
     def __getitem__(self, arg):
         return self.mData[arg]
+
+    '''
+    Batches - notifications are collected and sent once by endBatch
+    '''
+    def beginBatch(self):
+        with self.lock:
+            self.batchLevel += 1
+
+    def endBatch(self):
+        with self.lock:
+            self.batchLevel -= 1
+            if self.batchLevel > 0 or not self.changes:
+                return
+            changes = self.changes
+            self.changes = []
+        self.changesCommitted.emit(changes)
+
+    @contextmanager
+    def batch(self):
+        self.beginBatch()
+        try:
+            yield self
+        finally:
+            self.endBatch()
+
+    def emitChange(self, name, *args):
+        if self.batchLevel > 0:
+            self.changes.append((name, args))
+        else:
+            getattr(self, name).emit(*args)
+
+    '''
+    Workers
+    '''
+    def submitSignal(self, gName, cName, rData, rNames):
+        # may be called from any thread
+        self.submitSignals([(gName, cName, rData, rNames)])
+
+    def submitSignals(self, signals):
+        # [(group, signal, data, channels), ...], added together, a signal
+        # of the same name is replaced
+        self.handoverRequested.emit(list(signals))
+
+    def applyHandover(self, signals):
+        with self.lock, self.batch():
+            for gName, cName, rData, rNames in signals:
+                if gName not in self.gNames:
+                    self.createDataGroup(gName)
+                newChannels = [ch for ch in rNames if ch not in self.mData[gName].getRowNames()]
+                if newChannels:
+                    self.addChannels(gName, newChannels)
+                if cName in self.mData[gName].getColumnNames():
+                    self.removeSignal(gName, cName)
+                self.appendSignal(gName, cName, rNames, rData)
+
+    def getSnapshot(self, struct=None, inv=True):
+        # {group: {signal: data}} of struct (everything by default)
+        with self.lock:
+            if struct is None:
+                struct = self.getStructure(inv)
+            return self.getData(struct, inv)
     
     def setFs(self, fs):
-        self.fs = fs
+        with self.lock:
+            if fs == self.fs:
+                return
+            self.fs = fs
+        self.fsChanged.emit(fs)
     
     def getFs(self):
         return self.fs
+
+    def setDtype(self, dtype):
+        # precision of stored signals, existing ones are converted
+        with self.lock:
+            self.dtype = dtype
+            memo = {}
+            for gName in self.gNames:
+                self.mData[gName].setDtype(dtype, memo)
+
+    def getDtype(self):
+        return self.dtype
         
     def createDataGroup(self, gName, gKind='Normal'):
-        if gName in self.gNames:
-            print('This name already exists')
-            return
-        self.mData[gName] = MyData(self.fs)
-        self.gNames.append(gName)
-        self.dataGroupAdded.emit(gName, gKind)
+        with self.lock:
+            if gName in self.gNames:
+                print('This name already exists')
+                return
+            self.mData[gName] = MyData(self.fs, self.dtype, self.memory)
+            self.gNames.append(gName)
+            self.gKinds[gName] = gKind
+            self.emitChange('dataGroupAdded', gName, gKind)
     def removeAll(self):
-        self.gNames = []
-        self.mData = {}
-        self.allRemoved.emit()
+        with self.lock:
+            for gName in self.gNames:
+                self.mData[gName].clear()
+            self.gNames = []
+            self.gKinds = {}
+            self.mData = {}
+            self.emitChange('allRemoved')
+
+    def setMemoryBudget(self, maxBytes):
+        # None - no limit
+        with self.lock:
+            self.memory.setMaxBytes(maxBytes)
+
+    def getMemoryBudget(self):
+        return self.memory.maxBytes
+
+    def addMemoryCache(self, cache):
+        # the cache shrinks to what the stored signals leave of the budget
+        with self.lock:
+            self.memory.addCache(cache)
+
+    def getCacheUsage(self):
+        return self.memory.cacheBytes()
+
+    def pinSignal(self, gName, cName, isPinned=True):
+        # pinned signals are never moved to disk
+        with self.lock:
+            self[gName].pinColumn(cName, isPinned)
+
+    def getMemoryUsage(self, gName=None):
+        # {group: {signal: [bytes in memory, bytes on disk]}}
+        with self.lock:
+            gNames = self.gNames if gName is None else [gName]
+            return {g : self.mData[g].getMemoryUsage() for g in gNames}
 
     def getDataGroups(self):
         return self.gNames
 
+    def getGroupKind(self, gName):
+        return self.gKinds.get(gName, 'Normal')
+
     def addChannels(self, gName, chNames):
-        self[gName].addRows(chNames)
-        self.channelsAdded.emit(gName, chNames)
+        with self.lock:
+            self[gName].addRows(chNames)
+            self.emitChange('channelsAdded', gName, chNames)
 
     def addSignal(self, gName, cName, rData, rNames):
-        self[gName].addColumn(cName, rData, rNames)
-        self.signalAdded.emit(gName, cName, rNames)
+        with self.lock:
+            self[gName].addColumn(cName, rData, rNames)
+            self.emitChange('signalAdded', gName, cName, rNames)
 
     def silentChangeSignal(self, gName, cName, rData, rNames):
-        self[gName].addColumn(cName, rData, rNames)
+        with self.lock:
+            self[gName].addColumn(cName, rData, rNames)
+
+    def notifyRangeLoaded(self, gName, cName, start, stop):
+        self.rangeLoaded.emit(gName, cName, start, stop)
+
+    def getSignalChannels(self, gName, sName):
+        with self.lock:
+            return self.mData[gName].getColumnRows(sName)
+
+    def getChannelSignals(self, gName, chName):
+        with self.lock:
+            return self.mData[gName].getRowColumns(chName)
 
     def getStructure(self, inv=True):
-        struct = {}
-        for mdkey in self.mData:
-            if inv:
-                struct[mdkey] = self.mData[mdkey].getColStructure()
-            else:
-                struct[mdkey] = self.mData[mdkey].getRowStructure()
-        return struct
+        with self.lock:
+            struct = {}
+            for mdkey in self.mData:
+                if inv:
+                    struct[mdkey] = self.mData[mdkey].getColStructure()
+                else:
+                    struct[mdkey] = self.mData[mdkey].getRowStructure()
+            return struct
 
     def getData(self, struct, inv):
-        dStruct = {}
-        for group in struct:
-            dStruct[group] = self.mData[group].getDataFromStructure(struct[group], inv)
-        return dStruct
+        with self.lock:
+            dStruct = {}
+            for group in struct:
+                dStruct[group] = self.mData[group].getDataFromStructure(struct[group], inv)
+            return dStruct
 
     def appendData(self, struct, inv=True):
-        for group in struct:
-            self.mData[group].appendDataFromStructure(struct[group], inv=inv)
-        self.dataAdded.emit(struct)
+        with self.lock:
+            for group in struct:
+                self.mData[group].appendDataFromStructure(struct[group], inv=inv)
+            self.emitChange('dataAdded', struct)
 
     def appendSignal(self, group, signal, chList, data):
-        self.mData[group].addColumn(signal, data, chList)
-        self.signalAdded.emit(group, signal, chList)
+        with self.lock:
+            self.mData[group].addColumn(signal, data, chList)
+            self.emitChange('signalAdded', group, signal, chList)
 
     def changeSignal(self, group, signal, chList, data):
-        self.mData[group].addColumn(signal, data, chList)
-        self.signalChanged.emit(group, signal, chList)
+        with self.lock:
+            self.mData[group].addColumn(signal, data, chList)
+            self.emitChange('signalChanged', group, signal, chList)
 
     def removeSignal(self, group, signal):
-        self[group].removeColumn(signal)
-        self.signalRemoved.emit(group, signal)
+        with self.lock:
+            self[group].removeColumn(signal)
+            self.emitChange('signalRemoved', group, signal)
 
 '''
 
@@ -209,6 +823,7 @@ class DataSelector(QTreeWidget):
             self.itemChanged.connect(self.itemHasChanged)
         self.dm.signalAdded.connect(self.addItem)
         self.dm.signalRemoved.connect(self.removeItem)
+        self.dm.changesCommitted.connect(self.applyChanges)
 
     def _create(self):
         struct = self.dm.getStructure(self.isInverse)
@@ -292,6 +907,15 @@ class DataSelector(QTreeWidget):
             child.setText(0, k)
             child.setCheckState(0, Qt.Unchecked)
 
+    def applyChanges(self, changes):
+        handlers = {'signalAdded' : self.addItem,
+                    'signalRemoved' : self.removeItem}
+        self.setUpdatesEnabled(False)
+        for name, args in changes:
+            if name in handlers:
+                handlers[name](*args)
+        self.setUpdatesEnabled(True)
+
     def removeItem(self, itParent, itName):
         rootIter = QTreeWidgetItemIterator(self, QTreeWidgetItemIterator.HasChildren)
 
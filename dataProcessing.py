@@ -1,4 +1,6 @@
+import os
 import sys
+import tempfile
 import numpy as np
 from scipy import signal
 import scipy.io
@@ -12,6 +14,7 @@ from PySide2.QtWidgets import (QDialog, QComboBox, QGridLayout, QLabel,
 from PySide2.QtCore import Qt, Signal, QLocale
 from chartView import *
 from calculations import *
+from data import SPILL_DIR
 
 '''
 
@@ -21,13 +24,32 @@ ABSTRACT
 class AbstractProcessGroup(QGroupBox):
     
     progress = Signal(int)
+    dtype = np.float64
 
     def __init__(self, title, fs):
         QGroupBox.__init__(self, title)
         self.fs = fs
+
+    def setDtype(self, dtype):
+        self.dtype = dtype
+
+    def getParameters(self):
+        return {}
         
-    def process(self, inData):
-        pass
+    def process(self, inData, params=None, cancelled=None):
+        # may run on a worker thread, then params are read on the GUI thread;
+        # None when cancelled
+        if params is None:
+            params = self.getParameters()
+        if self.opName in rangeOperations:
+            # computed only for the ranges which are drawn or processed
+            self.progress.emit(100)
+            return derivedOperation(inData, self.fs, self.opName, params, self.dtype)
+        return processChannels(self.opName, inData, self.fs, params, self.dtype,
+                               progress=self.channelProgress, cancelled=cancelled)
+
+    def channelProgress(self, done, total):
+        self.progress.emit(int(100*done/total))
     
 '''
 
@@ -35,6 +57,8 @@ FILTER
 
 '''
 class FilterGroup(AbstractProcessGroup):
+
+    opName = 'Filtering'
     
     def __init__(self, title, fs):
         AbstractProcessGroup.__init__(self, title, fs)
@@ -83,6 +107,13 @@ class FilterGroup(AbstractProcessGroup):
         self.filterOrdEdit.setValue(5)
         filterOrdLayout.addRow(QLabel('Order'))
         filterOrdLayout.addRow(self.filterOrdEdit)
+        self.zeroPhaseCheck = QCheckBox('Zero phase')
+        self.zeroPhaseCheck.setToolTip('Filter forwards and backwards, no phase lag')
+        filterOrdLayout.addRow(self.zeroPhaseCheck)
+        self.streamCheck = QCheckBox('Stream to disk')
+        self.streamCheck.setToolTip('Filter the whole recording chunk by chunk into a file, '
+                                    'for recordings larger than memory')
+        filterOrdLayout.addRow(self.streamCheck)
         
         filterSettLayout.addLayout(filterTypeLayout)
         filterSettLayout.addSpacing(10)
@@ -106,18 +137,42 @@ class FilterGroup(AbstractProcessGroup):
         else:
             self.highFreqEdit.setEnabled(True)
 
+    def getParameters(self):
+        return {'btype' : self.filterBandChooser.currentData(),
+                'ftype' : self.filterTypeChooser.currentData(),
+                'order' : self.filterOrdEdit.value(),
+                'lowFreq' : self.lowFreqEdit.value(),
+                'highFreq' : self.highFreqEdit.value(),
+                'zeroPhase' : self.zeroPhaseCheck.isChecked(),
+                'stream' : self.streamCheck.isChecked()}
+
+    def process(self, inData, params=None, cancelled=None):
+        if params is None:
+            params = self.getParameters()
+        if not params['stream']:
+            return AbstractProcessGroup.process(self, inData, params, cancelled)
+        # the file is removed together with the signal, like spilled data
+        os.makedirs(SPILL_DIR, exist_ok=True)
+        fd, filePath = tempfile.mkstemp(suffix='.npy', prefix='{}_filter_'.format(os.getpid()),
+                                        dir=SPILL_DIR)
+        os.close(fd)
+        return filterToFile(inData, self.fs, params, filePath, self.dtype, self.progress.emit,
+                            cancelled=cancelled)
+
     def calcFilter(self):
-        bandArr = [x.value() for x in (self.lowFreqEdit, self.highFreqEdit) if x.isEnabled() == True]
-        return filterCalc(order=self.filterOrdEdit.value(),
-                          bandarr=bandArr,
+        params = self.getParameters()
+        return filterCalc(order=params['order'],
+                          bandarr=filterBand(params),
                           fs=self.fs,
-                          btype=self.filterBandChooser.currentData(),
-                          ftype=self.filterTypeChooser.currentData())
+                          btype=params['btype'],
+                          ftype=params['ftype'])
 
     def showFilterResponse(self):
         bandArr = [x.value() for x in (self.lowFreqEdit, self.highFreqEdit) if x.isEnabled() == True]
-        b, a = self.calcFilter()
-        w, h = signal.freqz(b, a)
+        w, h = signal.sosfreqz(self.calcFilter())
+        if self.zeroPhaseCheck.isChecked():
+            # forward and backward pass: squared magnitude, no phase shift
+            h = np.abs(h)**2
         fig = plt.figure()
         ax1 = fig.add_subplot(111)
         ax1.set_title(label='Filter frequency response\n{}, {}, {}Hz, ord={}'.format(self.filterBandChooser.currentText(),
@@ -137,18 +192,6 @@ class FilterGroup(AbstractProcessGroup):
         plt.axis('tight')
         plt.show()
 
-    def process(self, inData):
-        b, a = self.calcFilter()
-        outData = []
-        progStep = 100.0 / len(inData)
-        prog = 0
-        for data in inData:
-            newData = signal.lfilter(b, a, data)
-            outData.append(newData)
-            prog = prog + progStep
-            self.progress.emit(int(prog))
-        return outData
-
 
 '''
 
@@ -169,115 +212,57 @@ class WindowGroup(AbstractProcessGroup):
         self.winLenEdit.setMaximum(10000) #do poprawki
         self.winLenEdit.setValue(self.fs/10)
         wiinSettLayout.addRow('Lenght (samples)', self.winLenEdit)
-##        self.winOverEdit = QSpinBox()
-##        self.winOverEdit.setMaximum(10000)
-##        wiinSettLayout.addRow('Overlapping (samples)', self.winOverEdit)
-##        self.winBackOverEdit = QSpinBox()
-##        self.winBackOverEdit.setMaximum(10000)
-##        wiinSettLayout.addRow('Back Overlapping (samples)', self.winBackOverEdit)
-
-    def process(self, inData):
-        self.winLen = self.winLenEdit.value()
-##        winOver = self.winOverEdit.value()
-        segNmbr = int(np.shape(inData)[1]/(self.winLen))
-        progStep = 100.0 / len(inData)
-        prog = 0
-
-        outData = np.copy(inData)
-        outData = [np.array_split(ch, segNmbr) for ch in outData]
-        chi = 0
-        for ch in outData:
-            for seg in ch:
-                proc = self.operation(seg)
-                seg.fill(proc) 
-            prog = prog + progStep
-            self.progress.emit(int(prog))
-            chi += 1
-
-        outData = [np.concatenate(ch) for ch in outData]
-        return outData
+        # 0 - consecutive windows, otherwise a window every hop samples
+        self.winHopEdit = QSpinBox()
+        self.winHopEdit.setMaximum(10000)
+        self.winHopEdit.setSpecialValueText('No overlap')
+        wiinSettLayout.addRow('Hop (samples)', self.winHopEdit)
+
+    def getParameters(self):
+        return {'winLen' : self.winLenEdit.value(),
+                'hop' : self.winHopEdit.value()}
+
 '''
 AVERAGE
 '''
 class AverageGroup(WindowGroup):
-    def __init__(self, title, fs):
-        WindowGroup.__init__(self, title, fs)
-
-    def operation(self, seg):
-        return np.mean(seg)
+    opName = 'Average'
 
 '''
 ENERGY
 '''
-class EnergyGroup(WindowGroup):   
-    def __init__(self, title, fs):
-        WindowGroup.__init__(self, title, fs)
-
-    def operation(self, seg):
-        sen = [s**2 for s in seg]
-        return sum(sen)
+class EnergyGroup(WindowGroup):
+    opName = 'Energy'
 
 '''
 POWER
 '''
-class PowerGroup(WindowGroup):   
-    def __init__(self, title, fs):
-        WindowGroup.__init__(self, title, fs)
-
-    def operation(self, seg):
-        sen = [s**2 for s in seg]
-        return sum(sen)/self.winLen
+class PowerGroup(WindowGroup):
+    opName = 'Power'
   
 '''
 PEAK2PEAK
 '''
 class Peak2PeakGroup(WindowGroup):
-    def __init__(self, title, fs):
-        WindowGroup.__init__(self, title, fs)
+    opName = 'Peak-To-Peak'
 
-    def operation(self, seg):
-        return np.max(seg)- np.min(seg)
 '''
 VARIANCE
 '''
 class VarianceGroup(WindowGroup):
-    def __init__(self, title, fs):
-        WindowGroup.__init__(self, title, fs)
-
-    def operation(self, seg):
-        avg = np.mean(seg)
-        sq = [(s-avg)**2 for s in seg]
-        return sum(sq)/self.winLen
+    opName = 'Variance'
 
 '''
 ENTROPY
 '''
 class EntropyGroup(WindowGroup):
-    def __init__(self, title, fs):
-        WindowGroup.__init__(self, title, fs)
-
-    def operation(self, seg):
-        try:
-            sq = [s*np.log(abs(s)) for s in seg]
-        except:
-            print('log err in seg ', seg)
-        return -sum(sq)
+    opName = 'Entropy'
 
 '''
 SKEWNESS
 '''
 class SkewnessGroup(WindowGroup):
-    def __init__(self, title, fs):
-        WindowGroup.__init__(self, title, fs)
-
-    def operation(self, seg):
-        avg = np.mean(seg)
-        nomp = [(s-avg)**3 for s in seg]
-        denomp = [(s-avg)**2 for s in seg]
-
-        nom = sum(nomp)/self.winLen
-        denom = sum(denomp)/(self.winLen-1)**(3/2)
-        return nom/denom
+    opName = 'Skewness'
          
 
 '''
@@ -287,6 +272,8 @@ STFT
 '''
 class STFTGroup(AbstractProcessGroup):
 
+    opName = 'STFT'
+
     winTypes = ('boxcar', 'triang', 'blackman', 'hamming', 'hann', 'bartlett',
                 'flattop', 'parzen', 'bohman', 'blackmanharris', 'nuttall',
                 'barthann', 'kaiser', 'gaussian', 'slepian', 'chebwin')
@@ -360,38 +347,16 @@ class STFTGroup(AbstractProcessGroup):
             self.specWindows[curWindow][0].setVisible(True)
             self.specWindows[curWindow][1].setVisible(True)
 
-    def process(self, inData):
-
-        progStep = 100.0 / len(inData)
-        prog = 0
-        outData = []
-        chi = 0
-        
-        winName = (self.winTypeChooser.currentText())
+    def getParameters(self):
+        winName = self.winTypeChooser.currentText()
+        winParam = None
         if winName in self.specWindows:
             winParam = self.specWindows[winName][1].value()
-            window = (winName, winParam)
-        else:
-            window = winName
-            
-        maxFreq = self.maxFreqEdit.value()
-        for chData in inData:
-            f, t, Zxx = signal.stft(chData, fs=self.fs,
-                                    nperseg=self.nPerSegEdit.value(),
-                                    noverlap=self.nOverlapEdit.value(),
-                                    window=window)
-##            f = [fi for fi in f if float(fi) > minFreq and float(fi) < maxFreq]
-            f = [fi for fi in f if float(fi) <= maxFreq]
-            Zxx = Zxx[:len(f)]
-            t *= self.fs
-            Zxx = np.abs(Zxx)
-
-            outData.append([f, t, Zxx])
-            prog = prog + progStep
-            self.progress.emit(int(prog))
-            chi += 1
-
-        return outData
+        return {'window' : winName,
+                'winParam' : winParam,
+                'maxFreq' : self.maxFreqEdit.value(),
+                'nPerSeg' : self.nPerSegEdit.value(),
+                'nOverlap' : self.nOverlapEdit.value()}
 
 '''
 
@@ -400,6 +365,8 @@ CWT
 '''
 class CWTGroup(AbstractProcessGroup):
 
+    opName = 'CWT'
+
     winTypes = ('boxcar', 'triang', 'blackman', 'hamming', 'hann', 'bartlett',
                 'flattop', 'parzen', 'bohman', 'blackmanharris', 'nuttall',
                 'barthann', 'kaiser', 'gaussian', 'slepian', 'chebwin')
@@ -472,36 +439,9 @@ class CWTGroup(AbstractProcessGroup):
             self.specWindows[curWindow][0].setVisible(True)
             self.specWindows[curWindow][1].setVisible(True)
 
-    def process(self, inData):
-
-        progStep = 100.0 / len(inData)
-        prog = 0
-        outData = []
-        chi = 0
-        
-##        winName = (self.winTypeChooser.currentText())
-##        if winName in self.specWindows:
-##            winParam = self.specWindows[winName][1].value()
-##            window = (winName, winParam)
-##        else:
-##            window = winName
-##            
-##        maxFreq = self.maxFreqEdit.value()
-        
-        widths = np.arange(self.minScaleEdit.value(), self.maxScaleEdit.value()+1)
-        wavelet = signal.ricker
-##        wavelet = signal.morlet
-        for chData in inData:            
-            cwtmatr = signal.cwt(chData, wavelet, widths)
-##            print(type(cwtmatr))
-##            print(np.shape(cwtmatr))
-            cwtmatr = abs(cwtmatr)
-            outData.append(cwtmatr)
-            prog = prog + progStep
-            self.progress.emit(int(prog))
-            chi += 1
-
-        return outData
+    def getParameters(self):
+        return {'minScale' : self.minScaleEdit.value(),
+                'maxScale' : self.maxScaleEdit.value()}
 
 '''
 
@@ -509,6 +449,8 @@ THRESHOLD
 
 '''
 class ThresholdGroup(AbstractProcessGroup):
+
+    opName = 'Thresholding'
     
     def __init__(self, title, fs):
         AbstractProcessGroup.__init__(self, title, fs)
@@ -522,17 +464,8 @@ class ThresholdGroup(AbstractProcessGroup):
         self.thresEdit.setValue(0)
         mainLayout.addRow('Threshold value', self.thresEdit)
 
-    def process(self, inData):
-        thresh = self.thresEdit.value()
-        outData = []
-        progStep = 100.0 / len(inData)
-        prog = 0
-        for chData in inData:
-            a = [1 if a_ > thresh else 0 for a_ in chData]
-            outData.append(np.array(a))
-            prog = prog + progStep
-            self.progress.emit(int(prog))
-        return outData
+    def getParameters(self):
+        return {'threshold' : self.thresEdit.value()}
 
 
 '''
@@ -541,6 +474,8 @@ DETREND
 
 '''
 class DetrendGroup(AbstractProcessGroup):
+
+    opName = 'Detrend'
     
     def __init__(self, title, fs):
         AbstractProcessGroup.__init__(self, title, fs)
@@ -564,30 +499,9 @@ class DetrendGroup(AbstractProcessGroup):
         self.constCheck.setChecked(self._toggle)
         self.lineCheck.setChecked(not self._toggle)
 
-    def process(self, inData):
+    def getParameters(self):
         if self.constCheck.isChecked():
             dType = 'constant'
         elif self.lineCheck.isChecked():
             dType = 'linear'
-        print(dType)
-        outData = []
-        progStep = 100.0 / len(inData)
-        prog = 0
-        for chData in inData:
-            det = signal.detrend(chData, type=dType)
-            outData.append(det)
-            prog = prog + progStep
-            self.progress.emit(int(prog))
-        return outData
-
-
-
-
-
-
-
-
-
-
-        
-
+        return {'type' : dType}
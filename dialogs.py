@@ -9,7 +9,7 @@ from PySide2.QtWidgets import (QDialog, QComboBox, QGridLayout, QLabel,
                                QPushButton, QVBoxLayout, QStackedLayout,
                                QFileDialog, QWidget, QCheckBox,
                                QErrorMessage, QProgressBar)
-from PySide2.QtCore import Qt, Signal
+from PySide2.QtCore import Qt, Signal, QThread
 from chartView import *
 from dataProcessing import *
 from data import *
@@ -20,6 +20,39 @@ from data import *
 ################## DATA PROCESSING ##################
 
 '''
+class ProcessingJob(QThread):
+    # runs a processing group off the GUI thread, the result is handed over
+    # to the data manager (output - group, signal name, channels) before
+    # jobFinished(True)
+    jobFinished = Signal(bool)
+
+    def __init__(self, group, inData, params, dataManager, output, parent=None):
+        QThread.__init__(self, parent)
+        self.group = group
+        self.inData = inData
+        self.params = params
+        self.dataManager = dataManager
+        self.output = output
+        self.isCancelled = False
+
+    def run(self):
+        outData = None
+        try:
+            outData = self.group.process(self.inData, self.params, self.cancelled)
+        except Exception as e:
+            print('processing stopped', e)
+        if outData is not None:
+            gName, cName, rNames = self.output
+            self.dataManager.submitSignal(gName, cName, outData, rNames)
+        self.jobFinished.emit(outData is not None)
+
+    def cancel(self):
+        self.isCancelled = True
+
+    def cancelled(self):
+        return self.isCancelled
+
+
 class DataProcessingDialog(QDialog):
 
     '''
@@ -45,6 +78,7 @@ class DataProcessingDialog(QDialog):
         self.dataManager = dataManager
         self.setWindowTitle('Data Processing')
         self.inputList = inputList
+        self.job = None
         
         #Setup Layouts
         self.mainLayout = QGridLayout(self)
@@ -94,6 +128,7 @@ class DataProcessingDialog(QDialog):
     '''
     def createGroup(self, GroupClass, name, title):
         newGroup = GroupClass(title, fs=self.dataManager.getFs())
+        newGroup.setDtype(self.dataManager.getDtype())
         newGroup.progress.connect(self.updateProgress)
         index = self.processLayout.addWidget(newGroup)
         return index
@@ -129,16 +164,22 @@ class DataProcessingDialog(QDialog):
         self.progBar = QProgressBar()
         self.progBar.setVisible(False)
         bottomLayout.addWidget(self.progBar)
-        buttonBox = QDialogButtonBox(QDialogButtonBox.Ok
-                                     | QDialogButtonBox.Close)
-        buttonBox.accepted.connect(self.okBtnBox)
-        buttonBox.rejected.connect(self.close)
-        bottomLayout.addWidget(buttonBox)
+        self.stopBtn = QPushButton('Stop')
+        self.stopBtn.setVisible(False)
+        self.stopBtn.clicked.connect(self.stopJob)
+        bottomLayout.addWidget(self.stopBtn)
+        self.buttonBox = QDialogButtonBox(QDialogButtonBox.Ok
+                                          | QDialogButtonBox.Close)
+        self.buttonBox.accepted.connect(self.okBtnBox)
+        self.buttonBox.rejected.connect(self.close)
+        bottomLayout.addWidget(self.buttonBox)
         self.mainLayout.addLayout(bottomLayout, 3, 0)
 
     def okBtnBox(self):
+        if self.job is not None:
+            return
         inStruct = self.inTree.getSelectedStruct()
-        data = self.dataManager.getData(inStruct, inv=True)
+        data = self.dataManager.getSnapshot(inStruct)
         wName = list(data.keys())[0]
         gName = list(data[wName].keys())[0]
         outName = self.outNameEdit.text()
@@ -150,17 +191,94 @@ class DataProcessingDialog(QDialog):
             msgBox.setStandardButtons(QMessageBox.Ok | QMessageBox.Cancel);
             msgBox.setDefaultButton(QMessageBox.Ok);
             ret = msgBox.exec()
-            if ret == QMessageBox.Ok:
-                self.dataManager.removeSignal(wName, outName)
-                print('removed')
-            else:
+            if ret != QMessageBox.Ok:
                 return
-                       
-        self.progBar.setVisible(True)
-        outData = self.processLayout.currentWidget().process(data[wName][gName])
-        self.dataManager.appendSignal(wName, outName, inStruct[wName][gName], outData)
-        self.newDataAdded.emit(wName, gName, self.outNameEdit.text())
 
+        # the old signal is replaced only when the new one is ready
+        group = self.processLayout.currentWidget()
+        self.jobOutput = (wName, gName, outName)
+        self.job = ProcessingJob(group, data[wName][gName], group.getParameters(),
+                                 self.dataManager, (wName, outName, inStruct[wName][gName]), self)
+        self.job.jobFinished.connect(self.jobFinished)
+        self.setRunning(True)
+        self.job.start()
+
+    def jobFinished(self, isDone):
+        # the handover queued by the job has been applied already
+        if self.job is None:
+            return
+        self.job.wait()
+        self.job = None
+        self.setRunning(False)
+        if isDone:
+            self.newDataAdded.emit(*self.jobOutput)
+
+    def stopJob(self):
+        if self.job is not None:
+            self.job.cancel()
+
+    def setRunning(self, isRunning):
+        self.progBar.setValue(0)
+        self.progBar.setVisible(isRunning)
+        self.stopBtn.setVisible(isRunning)
+        self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(not isRunning)
+
+    def closeEvent(self, event):
+        if self.job is not None:
+            self.job.cancel()
+            self.job.wait()
+            self.job = None
+        QDialog.closeEvent(self, event)
 
     def updateProgress(self, prog):
             self.progBar.setValue(prog)
+
+
+'''
+
+################## EXPORT SIGNALS ##################
+
+'''
+class ExportDialog(QDialog):
+    def __init__(self, dataManager, fileManager, parent=None):
+        QDialog.__init__(self, parent)
+        self.dataManager = dataManager
+        self.fileManager = fileManager
+        self.setWindowTitle('Export signals')
+
+        self.mainLayout = QGridLayout(self)
+        inGroup = QGroupBox('Signals to export')
+        inLayout = QFormLayout(inGroup)
+        self.inTree = DataSelector(self.dataManager, onlyOne=False)
+        inLayout.addRow(self.inTree)
+        self.mainLayout.addWidget(inGroup, 0, 0)
+
+        bottomLayout = QHBoxLayout()
+        self.progBar = QProgressBar()
+        self.progBar.setVisible(False)
+        bottomLayout.addWidget(self.progBar)
+        buttonBox = QDialogButtonBox(QDialogButtonBox.Ok
+                                     | QDialogButtonBox.Close)
+        buttonBox.accepted.connect(self.okBtnBox)
+        buttonBox.rejected.connect(self.close)
+        bottomLayout.addWidget(buttonBox)
+        self.mainLayout.addLayout(bottomLayout, 1, 0)
+
+    def okBtnBox(self):
+        inStruct = self.inTree.getSelectedStruct()
+        if not inStruct:
+            return
+        data = self.dataManager.getData(inStruct, inv=True)
+        signals = {}
+        for wName in data:
+            signals[wName] = {}
+            for sName in data[wName]:
+                signals[wName][sName] = (inStruct[wName][sName], data[wName][sName])
+        self.progBar.setVisible(True)
+        self.progBar.setValue(0)
+        if self.fileManager.exportSignals(signals, self.dataManager.getFs(),
+                                          self.updateProgress):
+            self.close()
+
+    def updateProgress(self, done, total):
+        self.progBar.setValue(int(100*done/total))
@@ -9,10 +9,11 @@ from PySide2.QtWidgets import (QDialog, QComboBox, QGridLayout, QLabel,
                                QPushButton, QVBoxLayout, QStackedLayout,
                                QFileDialog, QWidget, QErrorMessage,
                                QDoubleSpinBox)
-from PySide2.QtCore import Qt, Signal, QLocale
+from PySide2.QtCore import Qt, Signal, QLocale, QThread
 from chartView import *
 from calculations import *
-import pyedflib
+from fileSources import (openRecording, SignalCache, ConcatenatedSource,
+                         exportSignals, importSignals)
 
 '''
 
@@ -21,19 +22,116 @@ import pyedflib
 '''
 class FileManager(object):
 
-    def __init__(self):
-        pass
+    def __init__(self, nWorkers=None):
+        self.cache = SignalCache()
+        self.nWorkers = nWorkers
 
     def openFile(self):
         fileDialog = OpenFileDialog()
         try:
-            filePath, data, chNames = fileDialog.getData()
+            filePath, data, chNames = fileDialog.getData(self.cache)
         except:
             return
 ##        fileDialog.show()
 ##        fileDialog.exec()
         return filePath, data, chNames
 
+    def openConsecutiveFiles(self):
+        fileDialog = OpenFileDialog()
+        try:
+            filePaths, data, chNames = fileDialog.getConsecutiveData()
+        except Exception as e:
+            print('opening skipped', e)
+            return
+        return filePaths, data, chNames
+
+    def exportSignals(self, signals, fs, progress=None):
+        filePath = QFileDialog.getSaveFileName(None, "Export signals", dir=".",
+                                               filter="HDF5 files (*.h5)")[0]
+        if filePath == '':
+            return False
+        if not filePath.endswith('.h5'):
+            filePath += '.h5'
+        try:
+            exportSignals(filePath, signals, fs, progress, self.nWorkers)
+        except Exception as e:
+            print('export failed', e)
+            return False
+        return True
+
+    def importSignals(self):
+        filePath = QFileDialog.getOpenFileName(None, "Import signals", dir=".",
+                                               filter="HDF5 files (*.h5)")[0]
+        if filePath == '':
+            return
+        try:
+            return importSignals(filePath)
+        except Exception as e:
+            print('import failed', e)
+            return
+
+    def setWorkers(self, nWorkers):
+        # processes decoding EDF files, None - one per core
+        self.nWorkers = nWorkers
+
+    def getWorkers(self):
+        return self.nWorkers
+
+    def createLoader(self, filePath, source):
+        return BackgroundLoader(self, filePath, source)
+
+    def finishLoading(self, filePath, source, isLoaded):
+        # called on the GUI thread once the loader has released the buffer
+        source.buffer = None
+        source.loadedUntil = 0
+        if not isLoaded:
+            self.cache.discard(filePath)
+            return None
+        try:
+            return self.cache.commit(filePath, source.chNames, source.fs,
+                                     source.fsList, source.nSamples)
+        except Exception as e:
+            print('caching skipped', e)
+            return None
+
+'''
+
+################## BACKGROUND LOADER ##################
+
+'''
+class BackgroundLoader(QThread):
+    rangeLoaded = Signal(int, int)
+    loadFinished = Signal(bool)
+
+    def __init__(self, fileManager, filePath, source, chunkSec=60, parent=None):
+        QThread.__init__(self, parent)
+        self.fileManager = fileManager
+        self.filePath = filePath
+        self.source = source
+        self.chunkSec = chunkSec
+        self.isCancelled = False
+
+    def run(self):
+        source = self.source
+        chunkLen = max(1, int(self.chunkSec*source.fs))
+        isLoaded = False
+        try:
+            out = self.fileManager.cache.create(self.filePath,
+                                                (len(source), max(source.nSamples)))
+            isLoaded = source.readRanges(out, chunkLen, self.fileManager.nWorkers,
+                                         self.rangeLoaded.emit, self.cancelled)
+            out.flush()
+            del out
+        except Exception as e:
+            print('background loading stopped', e)
+        self.loadFinished.emit(isLoaded)
+
+    def cancel(self):
+        self.isCancelled = True
+
+    def cancelled(self):
+        return self.isCancelled
+
 '''
 
 ################## OPEN FILE DIALOG ##################
@@ -43,28 +141,21 @@ class OpenFileDialog(QDialog):
     def __init__(self):
         QDialog.__init__(self)
 
-    def getData(self):
+    def getData(self, cache=None):
         fileObj = QFileDialog.getOpenFileName(self, "Choose the file", dir=".",
                                               filter="Data files (*.mat *.edf)")
         if fileObj[0] == '':
             return
         filePath = fileObj[0]
-        fileType = filePath.split('.')[-1]
-        chNames = None
-        if fileType == 'mat':
-            fileData = scipy.io.loadmat(filePath)
-            data = [fileData[key] for key in fileData if type(fileData[key]) == np.ndarray][0]
-            if np.shape(data)[0] > np.shape(data)[1]:
-                data = data.transpose()
-        elif fileType == 'edf':
-            f = pyedflib.EdfReader(filePath)
-            n = f.signals_in_file
-            chNames = f.getSignalLabels()
-            data = np.zeros((n, f.getNSamples()[0]))
-            for i in np.arange(n):
-                try:
-                    data[i, :] = f.readSignal(i)
-                except Exception as e:
-                    print(chNames[i], ' skipped', e)
-            print(np.shape(data))
+        data, chNames = openRecording(filePath, cache)
         return filePath, data, chNames
+
+    def getConsecutiveData(self):
+        fileObj = QFileDialog.getOpenFileNames(self, "Choose consecutive files", dir=".",
+                                               filter="EDF files (*.edf)")
+        if len(fileObj[0]) == 0:
+            return
+        # files are joined in name order
+        filePaths = sorted(fileObj[0])
+        data = ConcatenatedSource(filePaths)
+        return filePaths, data, data.chNames
@@ -0,0 +1,833 @@
+import os
+import json
+import hashlib
+import tempfile
+import weakref
+import threading
+from collections import OrderedDict
+import multiprocessing
+from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import scipy.io
+from scipy import signal
+import pyedflib
+import h5py
+
+'''
+
+################## LAZY CHANNEL ##################
+
+'''
+class LazyChannel(object):
+    ndim = 1
+
+    def __init__(self, nSamples, dtype=np.float64):
+        self.nSamples = int(nSamples)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return (self.nSamples,)
+
+    def __len__(self):
+        return self.nSamples
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.nSamples)
+            if step > 0:
+                return self.readRange(start, max(start, stop))[::step]
+            lo, hi = stop + 1, start + 1
+            return self.readRange(lo, max(lo, hi))[::step]
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self.nSamples
+            if key < 0 or key >= self.nSamples:
+                raise IndexError('sample index out of range')
+            return self.readRange(key, key+1)[0]
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.readRange(0, self.nSamples)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def readRange(self, start, stop):
+        raise NotImplementedError
+
+
+class ArrayChannel(LazyChannel):
+    def __init__(self, array):
+        LazyChannel.__init__(self, len(array), array.dtype)
+        self.array = array
+
+    def readRange(self, start, stop):
+        return self.array[max(0, int(start)):max(0, int(stop))]
+
+
+class ArraySource(object):
+    def __init__(self, array, chNames=None, fs=None, fsList=None, nSamples=None):
+        self.array = array
+        self.chNames = chNames
+        if nSamples is None:
+            nSamples = [array.shape[1]]*len(array)
+        self.nSamples = nSamples
+        self.fsList = fsList
+        self.nativeChannels = [ArrayChannel(array[i, :nSamples[i]])
+                               for i in range(len(array))]
+        if fsList is not None:
+            self.fs = commonRate(fsList)
+            self.channels = resampleChannels(self.nativeChannels, fsList, self.fs)
+        else:
+            self.fs = fs
+            self.channels = self.nativeChannels
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __getitem__(self, i):
+        return self.channels[i]
+
+    def __iter__(self):
+        return iter(self.channels)
+
+'''
+
+################## RESAMPLING ##################
+
+'''
+class ResampledChannel(LazyChannel):
+    def __init__(self, channel, fsIn, fsOut):
+        ratio = Fraction(fsOut/fsIn).limit_denominator(1000)
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+        LazyChannel.__init__(self, -(-len(channel)*self.up // self.down), channel.dtype)
+        self.channel = channel
+        self.fs = fsOut
+        # input samples needed on each side by the polyphase filter
+        self.pad = 10*max(self.up, self.down)//self.up + 1
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = max(start, min(self.nSamples, int(stop)))
+        if stop == start:
+            return np.empty(0, dtype=self.dtype)
+        # segment start on a multiple of down keeps output samples on the global grid
+        inStart = max(0, (start*self.down//self.up - self.pad)//self.down*self.down)
+        inStop = min(len(self.channel), -(-stop*self.down//self.up) + self.pad)
+        seg = self.channel.readRange(inStart, inStop)
+        out = signal.resample_poly(seg, self.up, self.down)
+        offset = inStart*self.up//self.down
+        return out[start-offset:stop-offset]
+
+
+def commonRate(fsList):
+    # the rate shared by most channels, the higher one on a tie
+    rates, counts = np.unique(np.asarray(fsList, dtype=np.float64), return_counts=True)
+    fs = rates[counts == counts.max()].max()
+    return int(fs) if float(fs).is_integer() else float(fs)
+
+def resampleChannels(channels, fsList, fs):
+    return [ch if fsList[i] == fs else ResampledChannel(ch, fsList[i], fs)
+            for i, ch in enumerate(channels)]
+
+'''
+
+################## EDF SOURCE ##################
+
+'''
+class EdfChannel(LazyChannel):
+    def __init__(self, source, chIndex, nSamples):
+        LazyChannel.__init__(self, nSamples)
+        self.source = source
+        self.chIndex = chIndex
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = min(self.nSamples, int(stop))
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        buffer = self.source.buffer
+        if buffer is not None and stop <= self.source.loadedUntil:
+            return buffer[self.chIndex, start:stop]
+        try:
+            with self.source.lock:
+                return self.source.reader.readSignal(self.chIndex, start=start,
+                                                     n=stop-start)
+        except Exception as e:
+            print(self.source.chNames[self.chIndex], ' skipped', e)
+            return np.zeros(stop-start, dtype=self.dtype)
+
+
+class EdfSource(object):
+    def __init__(self, filePath):
+        self.filePath = filePath
+        self.reader = pyedflib.EdfReader(filePath)
+        # the reader is not thread-safe, every read takes the lock
+        self.lock = threading.Lock()
+        self.chNames = self.reader.getSignalLabels()
+        self.nSamples = self.reader.getNSamples()
+        self.fsList = self.reader.getSampleFrequencies()
+        self.fs = commonRate(self.fsList)
+        # filled in the background by readRanges
+        self.buffer = None
+        self.loadedUntil = 0
+        # recordings sharing this reader through openEdf
+        self.users = 0
+        self.nativeChannels = [EdfChannel(self, i, self.nSamples[i])
+                               for i in range(self.reader.signals_in_file)]
+        self.channels = resampleChannels(self.nativeChannels, self.fsList, self.fs)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __getitem__(self, i):
+        return self.channels[i]
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def readAll(self, out, nWorkers=None, progress=None):
+        # channels are decoded in parallel when out is a file-backed memmap
+        nCh = len(self.nativeChannels)
+        if nWorkers is None:
+            nWorkers = os.cpu_count() or 1
+        nWorkers = min(nWorkers, nCh)
+        if nWorkers <= 1 or not isinstance(out, np.memmap) or out.filename is None:
+            for i in range(nCh):
+                seg = self.nativeChannels[i].readRange(0, out.shape[1])
+                out[i, :len(seg)] = seg
+                if progress is not None:
+                    progress(i+1, nCh)
+            return out
+        out.flush()
+        initArgs = (self.filePath, out.filename, out.offset, out.shape, out.dtype.str)
+        # spawned workers, a forked one inherits edflib's table of open files
+        with ProcessPoolExecutor(nWorkers, multiprocessing.get_context('spawn'),
+                                 initializer=_initDecoder, initargs=initArgs) as pool:
+            futures = [pool.submit(_decodeChannel, i) for i in range(nCh)]
+            done = 0
+            for future in as_completed(futures):
+                i, err = future.result()
+                if err is not None:
+                    print(self.chNames[i], ' skipped', err)
+                done += 1
+                if progress is not None:
+                    progress(done, nCh)
+        return out
+
+    def readRanges(self, out, chunkLen, nWorkers=None, progress=None, cancelled=None):
+        # time chunks of all channels, reads below loadedUntil use out
+        nSamples = out.shape[1]
+        chunks = [(start, min(start+chunkLen, nSamples))
+                  for start in range(0, nSamples, chunkLen)]
+        self.buffer = out
+        self.loadedUntil = 0
+        if nWorkers is None:
+            nWorkers = os.cpu_count() or 1
+        if nWorkers <= 1 or not isinstance(out, np.memmap) or out.filename is None:
+            for start, stop in chunks:
+                if cancelled is not None and cancelled():
+                    return False
+                for ch in self.nativeChannels:
+                    seg = ch.readRange(start, stop)
+                    out[ch.chIndex, start:start+len(seg)] = seg
+                self.loadedUntil = stop
+                if progress is not None:
+                    progress(start, stop)
+            return True
+        out.flush()
+        initArgs = (self.filePath, out.filename, out.offset, out.shape, out.dtype.str)
+        with ProcessPoolExecutor(nWorkers, multiprocessing.get_context('spawn'),
+                                 initializer=_initDecoder, initargs=initArgs) as pool:
+            futures = [pool.submit(_decodeRange, start, stop) for start, stop in chunks]
+            done = set()
+            nextChunk = 0
+            for future in as_completed(futures):
+                if cancelled is not None and cancelled():
+                    for f in futures:
+                        f.cancel()
+                    return False
+                start, stop = future.result()
+                done.add(start)
+                while nextChunk < len(chunks) and chunks[nextChunk][0] in done:
+                    nextChunk += 1
+                if nextChunk > 0 and chunks[nextChunk-1][1] > self.loadedUntil:
+                    prevLoaded = self.loadedUntil
+                    self.loadedUntil = chunks[nextChunk-1][1]
+                    if progress is not None:
+                        progress(prevLoaded, self.loadedUntil)
+        return True
+
+    def close(self):
+        self.reader.close()
+
+
+def edfSourceOf(channel):
+    # the EdfSource a channel reads from (resampled or not), None for others
+    if isinstance(channel, ResampledChannel):
+        channel = channel.channel
+    if isinstance(channel, EdfChannel):
+        return channel.source
+    return None
+
+def decodeEdf(source, filePath, nWorkers=None, progress=None):
+    # all channels decoded by readAll into a new .npy file, mapped as an ArraySource
+    out = np.lib.format.open_memmap(filePath, mode='w+', dtype=np.float64,
+                                    shape=(len(source), int(max(source.nSamples))))
+    source.readAll(out, nWorkers, progress)
+    out.flush()
+    del out
+    return ArraySource(np.load(filePath, mmap_mode='r'), source.chNames, source.fs,
+                       source.fsList, source.nSamples)
+
+'''
+
+################## CONSECUTIVE FILES ##################
+
+'''
+class ConcatenatedChannel(LazyChannel):
+    def __init__(self, source, chIndex):
+        offsets = source.offsets[chIndex]
+        LazyChannel.__init__(self, offsets[-1])
+        self.source = source
+        self.chIndex = chIndex
+        self.offsets = offsets
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = min(self.nSamples, int(stop))
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        # files covering [start, stop), found in the offset index
+        first = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        last = int(np.searchsorted(self.offsets, stop-1, side='right')) - 1
+        parts = []
+        # no other thread closes a file while it is read
+        with self.source.lock:
+            for i in range(first, last+1):
+                fileStart = self.offsets[i]
+                channel = self.source.fileSource(i).nativeChannels[self.chIndex]
+                parts.append(channel.readRange(max(start, fileStart)-fileStart,
+                                               min(stop, self.offsets[i+1])-fileStart))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+
+class ConcatenatedSource(object):
+    # consecutive EDF files shown as one continuous recording
+    def __init__(self, filePaths, maxOpen=4):
+        self.filePaths = list(filePaths)
+        self.maxOpen = max(1, maxOpen)
+        self.openSources = OrderedDict()
+        self.lock = threading.RLock()
+        nSamples = []
+        for i in range(len(self.filePaths)):
+            source = self.fileSource(i)
+            if i == 0:
+                self.chNames = source.chNames
+                self.fsList = source.fsList
+            elif len(source.nativeChannels) != len(self.chNames):
+                raise ValueError('different number of channels in ' + self.filePaths[i])
+            elif list(source.fsList) != list(self.fsList):
+                raise ValueError('different sampling rates in ' + self.filePaths[i])
+            elif source.chNames != self.chNames:
+                print('channel names differ in', self.filePaths[i])
+            nSamples.append(source.nSamples)
+        # offsets[ch][i] - first sample of file i in the continuous channel ch
+        nSamples = np.array(nSamples, dtype=np.int64).transpose()
+        self.offsets = np.zeros((len(nSamples), len(self.filePaths)+1), dtype=np.int64)
+        self.offsets[:, 1:] = np.cumsum(nSamples, axis=1)
+        self.nSamples = [int(n) for n in self.offsets[:, -1]]
+        self.fs = commonRate(self.fsList)
+        self.nativeChannels = [ConcatenatedChannel(self, i)
+                               for i in range(len(self.chNames))]
+        self.channels = resampleChannels(self.nativeChannels, self.fsList, self.fs)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __getitem__(self, i):
+        return self.channels[i]
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def fileSource(self, i):
+        # at most maxOpen files are kept open, the least recently read is
+        # released (its reader stays open while another recording uses it)
+        source = self.openSources.get(i)
+        if source is not None:
+            self.openSources.move_to_end(i)
+            return source
+        source = openEdf(self.filePaths[i])
+        self.openSources[i] = source
+        while len(self.openSources) > self.maxOpen:
+            closeEdf(self.openSources.popitem(last=False)[1])
+        return source
+
+    def close(self):
+        with self.lock:
+            while self.openSources:
+                closeEdf(self.openSources.popitem()[1])
+
+'''
+
+################## MATLAB v7.3 SOURCE ##################
+
+'''
+class HdfChannel(LazyChannel):
+    def __init__(self, dataset, chIndex, chAxis, nSamples=None):
+        if nSamples is None:
+            nSamples = dataset.shape[1-chAxis]
+        LazyChannel.__init__(self, nSamples, dataset.dtype)
+        self.dataset = dataset
+        self.chIndex = chIndex
+        self.chAxis = chAxis
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = max(start, min(self.nSamples, int(stop)))
+        # read in the stored orientation, no transpose of the matrix
+        if self.chAxis == 0:
+            return self.dataset[self.chIndex, start:stop]
+        return self.dataset[start:stop, self.chIndex]
+
+
+class Mat73Source(object):
+    def __init__(self, filePath):
+        self.filePath = filePath
+        self.file = h5py.File(filePath, 'r')
+        self.dataset = findDataMatrix(self.file)
+        if self.dataset is None:
+            raise ValueError('no data matrix in ' + filePath)
+        # channels along the shorter dimension, as for older .mat files
+        chAxis = int(np.argmin(self.dataset.shape))
+        self.chNames = None
+        self.fs = None
+        self.channels = [HdfChannel(self.dataset, i, chAxis)
+                         for i in range(self.dataset.shape[chAxis])]
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __getitem__(self, i):
+        return self.channels[i]
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def close(self):
+        self.file.close()
+
+
+def findDataMatrix(h5file):
+    # only dataset metadata is inspected, nothing is read
+    found = []
+    def visit(name, obj):
+        if name.startswith('#'):
+            return
+        if (isinstance(obj, h5py.Dataset) and len(obj.shape) == 2
+            and obj.dtype.kind in 'iuf' and min(obj.shape) > 0):
+            found.append(obj)
+    h5file.visititems(visit)
+    if not found:
+        return None
+    return max(found, key=lambda d: d.size)
+
+'''
+
+################## EXPORTED SIGNALS ##################
+
+'''
+# Derived signals are exported to HDF5, one group per data group and one
+# chunked, gzip compressed dataset per signal (channels in rows). Imported
+# signals are read back lazily, chunk by chunk.
+EXPORT_CHUNK = 1 << 16
+
+class HdfMatrix(LazyChannel):
+    # one channel of a 2D result (CWT, STFT magnitude), ranges along time
+    ndim = 2
+
+    def __init__(self, dataset, chIndex):
+        LazyChannel.__init__(self, dataset.shape[-1], dataset.dtype)
+        self.dataset = dataset
+        self.chIndex = chIndex
+
+    @property
+    def shape(self):
+        return tuple(self.dataset.shape[1:])
+
+    def __len__(self):
+        return self.dataset.shape[1]
+
+    def __getitem__(self, key):
+        return np.asarray(self)[key]
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = max(start, min(self.nSamples, int(stop)))
+        return self.dataset[self.chIndex, :, start:stop]
+
+
+def _signalKind(chData):
+    if isinstance(chData, list):
+        return 'stft'
+    # compact signal types are kept compact: one value per window, intervals
+    if hasattr(chData, 'edges'):
+        return 'windowed'
+    if hasattr(chData, 'starts'):
+        return 'intervals'
+    if np.ndim(chData) > 1:
+        return 'matrix'
+    return 'signal'
+
+def _writeSignal(h5group, name, data):
+    nSamples = [len(ch) for ch in data]
+    dtype = np.result_type(*[ch.dtype for ch in data])
+    dset = h5group.create_dataset(name, (len(data), max(nSamples)), dtype=dtype,
+                                  chunks=(1, min(EXPORT_CHUNK, max(1, max(nSamples)))),
+                                  compression='gzip', shuffle=True)
+    for i in range(len(data)):
+        # lazy sources are copied in blocks, never read as a whole
+        for start in range(0, nSamples[i], EXPORT_CHUNK):
+            stop = min(start+EXPORT_CHUNK, nSamples[i])
+            if isinstance(data[i], LazyChannel):
+                dset[i, start:stop] = data[i].readRange(start, stop)
+            else:
+                dset[i, start:stop] = data[i][start:stop]
+    dset.attrs['nSamples'] = nSamples
+    return dset
+
+def _writeWindowed(h5group, name, data):
+    # (n_channels, n_windows) values, window i covers samples edges[i]:edges[i+1]
+    sGroup = h5group.create_group(name)
+    sGroup.create_dataset('values', data=np.array([ch.values for ch in data]),
+                          compression='gzip', shuffle=True)
+    sGroup.create_dataset('edges', data=np.asarray(data[0].edges))
+    return sGroup
+
+def _writeIntervals(h5group, name, data):
+    # intervals of channel i are starts[offsets[i]:offsets[i+1]] (first sample)
+    # and stops[offsets[i]:offsets[i+1]] (one past the last)
+    offsets = np.zeros(len(data)+1, dtype=np.int64)
+    np.cumsum([len(ch.starts) for ch in data], out=offsets[1:])
+    sGroup = h5group.create_group(name)
+    sGroup.create_dataset('starts', data=np.concatenate([ch.starts for ch in data]))
+    sGroup.create_dataset('stops', data=np.concatenate([ch.stops for ch in data]))
+    sGroup.create_dataset('offsets', data=offsets)
+    sGroup.create_dataset('nSamples', data=np.array([ch.nSamples for ch in data], dtype=np.int64))
+    sGroup.attrs['dtype'] = np.dtype(data[0].dtype).str
+    return sGroup
+
+def _writeMatrix(h5group, name, data):
+    data = [np.asarray(ch) for ch in data]
+    nRows, nCols = data[0].shape
+    dset = h5group.create_dataset(name, (len(data), nRows, nCols), dtype=data[0].dtype,
+                                  chunks=(1, nRows, max(1, min(nCols, EXPORT_CHUNK//max(1, nRows)))),
+                                  compression='gzip', shuffle=True)
+    for i in range(len(data)):
+        dset[i] = data[i]
+    return dset
+
+def decodeEdfSignals(signals, tmpDir, nWorkers=None):
+    # channels still read from EDF files are swapped for the same channels of
+    # a copy decoded across nWorkers processes, each recording decoded once
+    decoded = {}
+    out = {}
+    for gName in signals:
+        out[gName] = {}
+        for sName in signals[gName]:
+            chNames, data = signals[gName][sName]
+            if isinstance(data, list):
+                channels = []
+                for ch in data:
+                    source = edfSourceOf(ch)
+                    if source is None:
+                        channels.append(ch)
+                        continue
+                    if id(source) not in decoded:
+                        path = os.path.join(tmpDir, '{}.npy'.format(len(decoded)))
+                        decoded[id(source)] = decodeEdf(source, path, nWorkers)
+                    copy = decoded[id(source)]
+                    if isinstance(ch, EdfChannel):
+                        channels.append(copy.nativeChannels[ch.chIndex])
+                    else:
+                        channels.append(copy.channels[ch.channel.chIndex])
+                data = channels
+            out[gName][sName] = (chNames, data)
+    return out
+
+def exportSignals(filePath, signals, fs=None, progress=None, nWorkers=None):
+    # signals - {group: {signal: (chNames, data)}}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        _exportSignals(filePath, decodeEdfSignals(signals, tmpDir, nWorkers), fs, progress)
+
+def _exportSignals(filePath, signals, fs=None, progress=None):
+    nSignals = sum(len(signals[gName]) for gName in signals)
+    done = 0
+    with h5py.File(filePath, 'w') as f:
+        if fs is not None:
+            f.attrs['fs'] = fs
+        for gName in signals:
+            h5group = f.create_group(gName)
+            for sName in signals[gName]:
+                chNames, data = signals[gName][sName]
+                kind = _signalKind(data[0])
+                if kind == 'stft':
+                    sGroup = h5group.create_group(sName)
+                    sGroup.create_dataset('f', data=np.asarray(data[0][0]))
+                    sGroup.create_dataset('t', data=np.asarray(data[0][1]))
+                    _writeMatrix(sGroup, 'Zxx', [ch[2] for ch in data])
+                    item = sGroup
+                elif kind == 'windowed':
+                    item = _writeWindowed(h5group, sName, data)
+                elif kind == 'intervals':
+                    item = _writeIntervals(h5group, sName, data)
+                elif kind == 'matrix':
+                    item = _writeMatrix(h5group, sName, data)
+                else:
+                    item = _writeSignal(h5group, sName, data)
+                item.attrs['kind'] = kind
+                item.attrs['channels'] = [str(ch) for ch in chNames]
+                done += 1
+                if progress is not None:
+                    progress(done, nSignals)
+
+def importSignals(filePath):
+    # returns ({group: {signal: (chNames, data)}}, fs), the file stays open
+    # as long as the imported signals are used
+    # signalTypes imports this module, so it is imported here
+    from signalTypes import WindowedSignal, IntervalSet
+    f = h5py.File(filePath, 'r')
+    fs = f.attrs.get('fs')
+    if fs is not None:
+        fs = float(fs)
+    signals = {}
+    for gName in f:
+        signals[gName] = {}
+        for sName in f[gName]:
+            item = f[gName][sName]
+            kind = item.attrs.get('kind', 'signal')
+            chNames = [str(ch) for ch in item.attrs['channels']]
+            if kind == 'stft':
+                fr, t = item['f'][()], item['t'][()]
+                data = [[fr, t, HdfMatrix(item['Zxx'], i)] for i in range(len(chNames))]
+            elif kind == 'windowed':
+                values, edges = item['values'][()], item['edges'][()]
+                data = [WindowedSignal(values[i], edges) for i in range(len(chNames))]
+            elif kind == 'intervals':
+                starts, stops = item['starts'][()], item['stops'][()]
+                offsets, nSamples = item['offsets'][()], item['nSamples'][()]
+                dtype = np.dtype(item.attrs['dtype'])
+                data = [IntervalSet(starts[offsets[i]:offsets[i+1]], stops[offsets[i]:offsets[i+1]],
+                                    int(nSamples[i]), dtype) for i in range(len(chNames))]
+            elif kind == 'matrix':
+                data = [HdfMatrix(item, i) for i in range(len(chNames))]
+            else:
+                nSamples = item.attrs['nSamples']
+                data = [HdfChannel(item, i, 0, nSamples[i]) for i in range(len(chNames))]
+            signals[gName][sName] = (chNames, data)
+    return signals, fs
+
+# worker process state for EdfSource.readAll and readRanges
+_decoder = {}
+
+def _initDecoder(filePath, outPath, offset, shape, dtype):
+    _decoder['reader'] = pyedflib.EdfReader(filePath)
+    _decoder['out'] = np.memmap(outPath, dtype=np.dtype(dtype), mode='r+',
+                                offset=offset, shape=tuple(shape))
+
+def _decodeChannel(i):
+    out = _decoder['out']
+    try:
+        seg = _decoder['reader'].readSignal(i)[:out.shape[1]]
+        out[i, :len(seg)] = seg
+        out.flush()
+    except Exception as e:
+        return i, str(e)
+    return i, None
+
+def _decodeRange(start, stop):
+    reader = _decoder['reader']
+    out = _decoder['out']
+    nSamples = reader.getNSamples()
+    for i in range(reader.signals_in_file):
+        n = min(stop, nSamples[i]) - start
+        if n <= 0:
+            continue
+        try:
+            out[i, start:start+n] = reader.readSignal(i, start=start, n=n)
+        except Exception as e:
+            print(reader.getLabel(i), ' skipped', e)
+    out.flush()
+    return start, stop
+
+'''
+
+################## SIGNAL CACHE ##################
+
+'''
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.ecog_analyzer', 'cache')
+CACHE_MAX_BYTES = 20 * 1024**3
+
+def fileKey(filePath, nBlocks=16, blockSize=1 << 16):
+    # hash of the file's path, size and modification time and of evenly spaced
+    # blocks of its content, an edited file gets a new key even when its size
+    # and the sampled blocks stay the same
+    st = os.stat(filePath)
+    size = st.st_size
+    header = '{}|{}|{}'.format(os.path.abspath(filePath), size, st.st_mtime_ns)
+    h = hashlib.blake2b(header.encode(), digest_size=16)
+    with open(filePath, 'rb') as f:
+        if size <= nBlocks*blockSize:
+            h.update(f.read())
+        else:
+            for pos in np.linspace(0, size-blockSize, nBlocks).astype(np.int64):
+                f.seek(int(pos))
+                h.update(f.read(blockSize))
+    return h.hexdigest()
+
+
+class SignalCache(object):
+    def __init__(self, cacheDir=CACHE_DIR, maxBytes=CACHE_MAX_BYTES):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.cacheDir, key)
+        return base + '.npy', base + '.json'
+
+    def load(self, filePath):
+        dataPath, headerPath = self._paths(fileKey(filePath))
+        if not (os.path.exists(dataPath) and os.path.exists(headerPath)):
+            return None
+        try:
+            with open(headerPath, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+            data = np.load(dataPath, mmap_mode='r')
+        except Exception as e:
+            print('cache entry skipped', e)
+            return None
+        os.utime(dataPath)
+        return ArraySource(data, header['chNames'], header['fs'],
+                           header.get('fsList'), header.get('nSamples'))
+
+    def create(self, filePath, shape, dtype=np.float64):
+        dataPath, headerPath = self._paths(fileKey(filePath))
+        return np.lib.format.open_memmap(dataPath + '.part', mode='w+', dtype=dtype,
+                                         shape=tuple(int(n) for n in shape))
+
+    def commit(self, filePath, chNames=None, fs=None, fsList=None, nSamples=None):
+        # the memmap returned by create() must be flushed and released first
+        dataPath, headerPath = self._paths(fileKey(filePath))
+        os.replace(dataPath + '.part', dataPath)
+        header = {'source' : os.path.abspath(filePath),
+                  'chNames' : list(chNames) if chNames is not None else None,
+                  'fs' : fs,
+                  'fsList' : [float(f) for f in fsList] if fsList is not None else None,
+                  'nSamples' : [int(n) for n in nSamples] if nSamples is not None else None}
+        with open(headerPath, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        self.evict()
+        return self.load(filePath)
+
+    def discard(self, filePath):
+        dataPath, headerPath = self._paths(fileKey(filePath))
+        try:
+            os.remove(dataPath + '.part')
+        except OSError:
+            pass
+
+    def store(self, filePath, data, chNames=None, fs=None, nWorkers=None, progress=None):
+        if isinstance(data, EdfSource):
+            out = self.create(filePath, (len(data), max(data.nSamples)))
+            data.readAll(out, nWorkers, progress)
+            fsList, nSamples = data.fsList, data.nSamples
+        else:
+            out = self.create(filePath, np.shape(data), np.asarray(data).dtype)
+            out[:] = data
+            fsList, nSamples = None, None
+        out.flush()
+        del out
+        return self.commit(filePath, chNames, fs, fsList, nSamples)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if name.endswith('.npy'):
+                path = os.path.join(self.cacheDir, name)
+                st = os.stat(path)
+                entries.append([st.st_mtime, st.st_size, path])
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        while entries and total > self.maxBytes:
+            mtime, size, path = entries.pop(0)
+            for p in (path, path[:-4] + '.json'):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+
+'''
+
+################## OPEN RECORDING ##################
+
+'''
+# pyedflib refuses to open the same file twice, so readers are shared;
+# every openEdf is matched by a closeEdf, the last one closes the reader
+_edfSources = weakref.WeakValueDictionary()
+
+def openEdf(filePath):
+    key = os.path.abspath(filePath)
+    source = _edfSources.get(key)
+    if source is None:
+        source = EdfSource(filePath)
+        _edfSources[key] = source
+    source.users += 1
+    return source
+
+def closeEdf(source):
+    source.users -= 1
+    if source.users > 0:
+        return
+    key = os.path.abspath(source.filePath)
+    if _edfSources.get(key) is source:
+        del _edfSources[key]
+    source.close()
+
+def openRecording(filePath, cache=None):
+    if cache is not None:
+        source = cache.load(filePath)
+        if source is not None:
+            print('cache hit', np.shape(source.array))
+            return source, source.chNames
+    fileType = filePath.split('.')[-1]
+    chNames = None
+    data = None
+    if fileType == 'mat' and h5py.is_hdf5(filePath):
+        data = Mat73Source(filePath)
+        print(len(data), 'channels,', len(data[0]), 'samples')
+    elif fileType == 'mat':
+        fileData = scipy.io.loadmat(filePath)
+        data = [fileData[key] for key in fileData if type(fileData[key]) == np.ndarray][0]
+        if np.shape(data)[0] > np.shape(data)[1]:
+            data = data.transpose()
+        if cache is not None:
+            data = cache.store(filePath, data)
+    elif fileType == 'edf':
+        data = openEdf(filePath)
+        chNames = data.chNames
+        print(len(data), 'channels,', data.nSamples[0], 'samples')
+    return data, chNames
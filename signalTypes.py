@@ -0,0 +1,204 @@
+import numpy as np
+from fileSources import LazyChannel
+
+'''
+
+################## WINDOWED SIGNALS ##################
+
+'''
+def windowEdges(nSamples, winLen):
+    # window boundaries of np.array_split(signal, int(nSamples/winLen)),
+    # the first nSamples % nWindows windows are one sample longer
+    nWindows = max(1, int(nSamples/winLen))
+    winSize, nLonger = divmod(nSamples, nWindows)
+    sizes = np.full(nWindows, winSize, dtype=np.int64)
+    sizes[:nLonger] += 1
+    edges = np.zeros(nWindows+1, dtype=np.int64)
+    np.cumsum(sizes, out=edges[1:])
+    return edges
+
+def hopEdges(nSamples, winLen, hop):
+    # windows of winLen samples every hop samples, each value is shown over
+    # the hop around its window's centre, the first and last reach the ends
+    nWindows = (nSamples - winLen)//hop + 1
+    edges = np.arange(nWindows+1, dtype=np.int64)*hop + (winLen - hop)//2
+    edges[0] = 0
+    edges[-1] = nSamples
+    return edges
+
+
+class WindowedSignal(LazyChannel):
+    # One value per window, window i covers samples edges[i]:edges[i+1].
+    # Reads expand the values to samples, only for the requested range.
+    def __init__(self, values, edges):
+        LazyChannel.__init__(self, edges[-1], values.dtype)
+        self.values = values
+        self.edges = edges
+
+    def windowIndex(self, i):
+        return int(np.searchsorted(self.edges, i, side='right')) - 1
+
+    def windowLengths(self):
+        return np.diff(self.edges)
+
+    def windowRange(self, start, stop):
+        # first and last window touching samples [start, stop)
+        return self.windowIndex(start), self.windowIndex(stop-1)
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = min(self.nSamples, int(stop))
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        first, last = self.windowRange(start, stop)
+        lengths = np.diff(np.clip(self.edges[first:last+2], start, stop))
+        return np.repeat(self.values[first:last+1], lengths)
+
+    def steps(self, start, stop):
+        # x, y for drawstyle='steps-post' over samples [start, stop)
+        start = max(0, int(start))
+        stop = min(self.nSamples, int(stop))
+        if stop <= start:
+            return np.empty(0), np.empty(0, dtype=self.dtype)
+        first, last = self.windowRange(start, stop)
+        x = np.clip(self.edges[first:last+2], start, stop)
+        y = np.append(self.values[first:last+1], self.values[last])
+        return x, y
+
+    def sum(self):
+        return np.sum(self.values*self.windowLengths())
+
+    def astype(self, dtype):
+        if self.values.dtype == dtype:
+            return self
+        return WindowedSignal(self.values.astype(dtype), self.edges)
+
+    def withValues(self, values):
+        # same windows, other values
+        return WindowedSignal(values, self.edges)
+
+
+def windowedSignals(values, edges):
+    # (n_channels, n_windows) values to one WindowedSignal per channel
+    return [WindowedSignal(values[i], edges) for i in range(len(values))]
+
+
+'''
+
+################## INTERVAL SETS ##################
+
+'''
+def runs(flags):
+    # [start, stop) of every run of True in a boolean array
+    bounds = np.flatnonzero(np.diff(np.concatenate(([False], flags, [False])).astype(np.int8)))
+    return bounds[0::2], bounds[1::2]
+
+def mergeIntervals(starts, stops):
+    # sorted, disjoint intervals covering the same samples,
+    # overlapping and touching intervals are joined
+    if len(starts) == 0:
+        return starts, stops
+    order = np.argsort(starts, kind='stable')
+    starts, stops = starts[order], stops[order]
+    ends = np.maximum.accumulate(stops)
+    first = np.flatnonzero(np.concatenate(([True], starts[1:] > ends[:-1])))
+    last = np.append(first[1:]-1, len(starts)-1)
+    return starts[first], ends[last]
+
+
+class IntervalSet(LazyChannel):
+    # Binary signal as sorted, disjoint [start, stop) sample intervals, 1 inside
+    # an interval and 0 elsewhere. Its size grows with the events, not the samples.
+    def __init__(self, starts, stops, nSamples, dtype=np.float64):
+        LazyChannel.__init__(self, nSamples, dtype)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.stops = np.asarray(stops, dtype=np.int64)
+
+    def visible(self, start, stop):
+        # intervals overlapping [start, stop), clipped to it
+        if stop <= start:
+            return self.starts[:0], self.stops[:0]
+        first = np.searchsorted(self.stops, start, side='right')
+        last = np.searchsorted(self.starts, stop, side='left')
+        return (np.clip(self.starts[first:last], start, stop),
+                np.clip(self.stops[first:last], start, stop))
+
+    def count(self, start=0, stop=None):
+        # number of intervals overlapping [start, stop)
+        if stop is None:
+            stop = self.nSamples
+        return len(self.visible(start, stop)[0])
+
+    def sum(self):
+        # number of samples inside the intervals
+        return int(np.sum(self.stops - self.starts))
+
+    def readRange(self, start, stop):
+        start = max(0, int(start))
+        stop = min(self.nSamples, int(stop))
+        if stop <= start:
+            return np.empty(0, dtype=self.dtype)
+        starts, stops = self.visible(start, stop)
+        steps = np.zeros(stop-start+1, dtype=np.int8)
+        steps[starts-start] += 1
+        steps[stops-start] -= 1
+        return np.cumsum(steps[:-1]).astype(self.dtype)
+
+    def combine(self, others, minCount):
+        # samples inside at least minCount of the sets
+        sets = [self] + list(others)
+        pos = np.concatenate([b for s in sets for b in (s.starts, s.stops)])
+        nSamples = max(s.nSamples for s in sets)
+        if len(pos) == 0:
+            return IntervalSet(pos, pos, nSamples, self.dtype)
+        delta = np.concatenate([np.full(len(b), d, dtype=np.int64) for s in sets
+                                for b, d in ((s.starts, 1), (s.stops, -1))])
+        order = np.argsort(pos, kind='stable')
+        pos, delta = pos[order], delta[order]
+        bounds, index = np.unique(pos, return_index=True)
+        inside = np.cumsum(np.add.reduceat(delta, index)) >= minCount
+        first, last = runs(inside[:-1])
+        return IntervalSet(bounds[first], bounds[last], nSamples, self.dtype)
+
+    def union(self, *others):
+        return self.combine(others, 1)
+
+    def intersection(self, *others):
+        return self.combine(others, len(others)+1)
+
+    def astype(self, dtype):
+        if self.dtype == dtype:
+            return self
+        return IntervalSet(self.starts, self.stops, self.nSamples, dtype)
+
+
+def maskIntervals(flags, dtype=np.float64):
+    starts, stops = runs(np.asarray(flags, dtype=bool))
+    return IntervalSet(starts, stops, len(flags), dtype)
+
+def windowIntervals(edges, flags, dtype=np.float64):
+    # windows with a True flag, neighbouring windows form one interval
+    first, last = runs(np.asarray(flags, dtype=bool))
+    return IntervalSet(edges[first], edges[last], edges[-1], dtype)
+
+def thresholdIntervals(source, threshold, dtype=np.float64, blockLen=1 << 16):
+    # samples above threshold, the source is read block by block
+    starts, stops = [], []
+    for blockStart in range(0, len(source), blockLen):
+        block = np.asarray(source[blockStart:blockStart+blockLen])
+        first, last = runs(block > threshold)
+        starts.append(first + blockStart)
+        stops.append(last + blockStart)
+    if not starts:
+        return IntervalSet([], [], len(source), dtype)
+    starts, stops = mergeIntervals(np.concatenate(starts), np.concatenate(stops))
+    return IntervalSet(starts, stops, len(source), dtype)
+
+def toIntervals(mask):
+    # masks of any kind, 1 marks the masked samples
+    if isinstance(mask, IntervalSet):
+        return mask
+    if isinstance(mask, WindowedSignal):
+        return windowIntervals(mask.edges, mask.values == 1, mask.dtype)
+    mask = np.asarray(mask)
+    return maskIntervals(mask == 1, mask.dtype)
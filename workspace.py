@@ -0,0 +1,202 @@
+import os
+import json
+import shutil
+import numpy as np
+from fileSources import LazyChannel
+from signalTypes import WindowedSignal, IntervalSet
+
+'''
+
+################## WORKSPACE FILES ##################
+
+'''
+# A workspace is a JSON file with the group/signal structure, chart settings
+# and algorithm parameters. Signal payloads are .npy files in the directory
+# <workspace>.data and are memory-mapped when the workspace is loaded.
+#
+# Values are described as {'npy': file}, {'list': [...], 'id': n},
+# {'ref': n} (the same list object as 'id' n), {'windowed': file, 'edges': file}
+# (one value per window), {'intervals': file, 'nSamples': n, 'dtype': d}
+# (start/stop pairs of a binary signal) or {'value': v}.
+
+WORKSPACE_VERSION = 1
+COPY_BLOCK = 1 << 20
+
+def payloadDir(filePath):
+    return filePath + '.data'
+
+
+class PayloadWriter(object):
+    def __init__(self, dataDir):
+        self.dataDir = dataDir
+        self.nFiles = 0
+        self.memo = {}
+        # window edges shared by the channels of one signal are saved once
+        self.edgeFiles = {}
+
+    def newFile(self):
+        fileName = '{}.npy'.format(self.nFiles)
+        self.nFiles += 1
+        return fileName
+
+    def saveArray(self, data):
+        fileName = self.newFile()
+        np.save(os.path.join(self.dataDir, fileName), data)
+        return fileName
+
+    def saveChannels(self, channels):
+        # lazy channels are copied block by block into one (n_ch, n) array
+        fileName = self.newFile()
+        nSamples = [len(ch) for ch in channels]
+        dtype = np.result_type(*[ch.dtype for ch in channels])
+        out = np.lib.format.open_memmap(os.path.join(self.dataDir, fileName), mode='w+',
+                                        dtype=dtype, shape=(len(channels), max(nSamples)))
+        for i in range(len(channels)):
+            for start in range(0, nSamples[i], COPY_BLOCK):
+                stop = min(start+COPY_BLOCK, nSamples[i])
+                out[i, start:stop] = channels[i].readRange(start, stop)
+        out.flush()
+        del out
+        return fileName, nSamples
+
+    def saveEdges(self, edges):
+        if id(edges) not in self.edgeFiles:
+            self.edgeFiles[id(edges)] = (edges, self.saveArray(edges))
+        return self.edgeFiles[id(edges)][1]
+
+    def encode(self, value):
+        if isinstance(value, WindowedSignal):
+            return {'windowed' : self.saveArray(value.values),
+                    'edges' : self.saveEdges(value.edges)}
+        if isinstance(value, IntervalSet):
+            return {'intervals' : self.saveArray(np.array([value.starts, value.stops])),
+                    'nSamples' : value.nSamples,
+                    'dtype' : value.dtype.str}
+        if isinstance(value, LazyChannel) and value.ndim == 1:
+            fileName, nSamples = self.saveChannels([value])
+            return {'npy' : fileName, 'row' : 0}
+        if isinstance(value, (np.ndarray, LazyChannel)):
+            return {'npy' : self.saveArray(np.asarray(value))}
+        if isinstance(value, list):
+            if id(value) in self.memo:
+                return {'ref' : self.memo[id(value)]}
+            n = len(self.memo)
+            self.memo[id(value)] = n
+            return {'list' : [self.encode(v) for v in value], 'id' : n}
+        if isinstance(value, np.generic):
+            value = value.item()
+        return {'value' : value}
+
+    def encodeColumn(self, data):
+        if isinstance(data, np.ndarray):
+            return {'npy' : self.saveArray(data)}
+        if (len(data) > 0 and all(isinstance(d, LazyChannel) and d.ndim == 1
+                                  and not isinstance(d, (WindowedSignal, IntervalSet)) for d in data)):
+            fileName, nSamples = self.saveChannels(data)
+            return {'npy' : fileName, 'nSamples' : nSamples}
+        return {'rows' : [self.encode(d) for d in data]}
+
+
+class PayloadReader(object):
+    def __init__(self, dataDir):
+        self.dataDir = dataDir
+        self.memo = {}
+
+    def loadArray(self, fileName):
+        return np.load(os.path.join(self.dataDir, fileName), mmap_mode='r')
+
+    def decode(self, desc):
+        if 'npy' in desc:
+            data = self.loadArray(desc['npy'])
+            if 'row' in desc:
+                return data[desc['row']]
+            return data
+        if 'windowed' in desc:
+            return WindowedSignal(self.loadArray(desc['windowed']),
+                                  np.load(os.path.join(self.dataDir, desc['edges'])))
+        if 'intervals' in desc:
+            bounds = np.load(os.path.join(self.dataDir, desc['intervals']))
+            return IntervalSet(bounds[0], bounds[1], desc['nSamples'], np.dtype(desc['dtype']))
+        if 'ref' in desc:
+            return self.memo[desc['ref']]
+        if 'list' in desc:
+            value = []
+            self.memo[desc['id']] = value
+            value.extend(self.decode(d) for d in desc['list'])
+            return value
+        return desc['value']
+
+    def decodeColumn(self, desc):
+        if 'rows' in desc:
+            return [self.decode(d) for d in desc['rows']]
+        data = self.loadArray(desc['npy'])
+        if 'nSamples' in desc and min(desc['nSamples']) < data.shape[1]:
+            return [data[i, :desc['nSamples'][i]] for i in range(len(data))]
+        return data
+
+
+def describeGroup(myData, writer):
+    signals = []
+    for cName in myData.getColumnNames():
+        column = myData.columns.get(cName)
+        if column is None:
+            signals.append({'name' : cName, 'rows' : [], 'data' : None})
+            continue
+        signals.append({'name' : cName,
+                        'rows' : list(column.rNames),
+                        'data' : writer.encodeColumn(column.data)})
+    return {'rows' : list(myData.getRowNames()),
+            'pinned' : sorted(myData.pinned),
+            'signals' : signals}
+
+def readGroup(desc, reader):
+    for sDesc in desc['signals']:
+        if sDesc['data'] is not None:
+            sDesc['data'] = reader.decodeColumn(sDesc['data'])
+    return desc
+
+def saveWorkspace(filePath, dataManager, chartData, settings):
+    # payloads are written to a new directory first, the previous one may
+    # still be memory-mapped by the loaded workspace
+    dataDir = payloadDir(filePath)
+    tmpDir = dataDir + '.tmp'
+    shutil.rmtree(tmpDir, ignore_errors=True)
+    os.makedirs(tmpDir)
+    writer = PayloadWriter(tmpDir)
+    with dataManager.lock:
+        groups = []
+        for gName in dataManager.getDataGroups():
+            group = describeGroup(dataManager[gName], writer)
+            group['name'] = gName
+            group['kind'] = dataManager.getGroupKind(gName)
+            groups.append(group)
+        chartGroups = {}
+        for gName in chartData.getDataGroups():
+            chartGroups[gName] = describeGroup(chartData[gName], writer)
+        state = {'version' : WORKSPACE_VERSION,
+                 'fs' : dataManager.getFs(),
+                 'dtype' : np.dtype(dataManager.getDtype()).str,
+                 'groups' : groups,
+                 'chart' : chartGroups,
+                 'settings' : settings}
+    if os.path.exists(dataDir):
+        oldDir = dataDir + '.old'
+        shutil.rmtree(oldDir, ignore_errors=True)
+        os.replace(dataDir, oldDir)
+        shutil.rmtree(oldDir, ignore_errors=True)
+    os.replace(tmpDir, dataDir)
+    with open(filePath, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+
+def loadWorkspace(filePath):
+    with open(filePath, encoding='utf-8') as f:
+        state = json.load(f)
+    if state.get('version') != WORKSPACE_VERSION:
+        raise ValueError('unsupported workspace version')
+    reader = PayloadReader(payloadDir(filePath))
+    state['dtype'] = np.dtype(state['dtype'])
+    for group in state['groups']:
+        readGroup(group, reader)
+    for gName in state['chart']:
+        readGroup(state['chart'][gName], reader)
+    return state